@@ -0,0 +1,309 @@
+"""Helpers shared by the benchmark scenarios: the load driver, result reporting and the
+stand-ins for external dependencies (S3, AMQP, media origin).
+
+Scenarios run with their service's directory as the working directory and on ``sys.path``
+(services use flat module names like ``config`` and ``main``), so nothing here may import
+service code at module level.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+RESULT_PREFIX = "BENCH_RESULT "
+BUCKET = "mp3-converter"
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class Result:
+    scenario: str
+    ops: int
+    errors: int
+    duration_s: float
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_rss_mb: float
+    extra: dict[str, float] = field(default_factory=dict)
+
+
+def parse_args(description: str, **defaults: Any) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--concurrency", type=int, default=defaults.get("concurrency", 16))
+    parser.add_argument("--duration", type=float, default=defaults.get("duration", 10.0))
+    parser.add_argument("--warmup", type=float, default=defaults.get("warmup", 1.0))
+    for name, value in defaults.items():
+        if name not in {"concurrency", "duration", "warmup"}:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    return parser.parse_args()
+
+
+def max_rss_mb(children: bool = False) -> float:
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    # Linux reports kilobytes.
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+async def drive(
+    op: Callable[[], Awaitable[None]], *, concurrency: int, duration: float, warmup: float
+) -> tuple[list[float], int, float]:
+    """Closed-loop load: ``concurrency`` workers call ``op`` back to back.
+
+    Latencies from the first ``warmup`` seconds are discarded. Returns latencies (seconds),
+    the error count and the measured wall time.
+    """
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while (now := time.perf_counter()) < deadline:
+            try:
+                await op()
+            except Exception as exc:
+                if now >= measure_from:
+                    errors += 1
+                    if errors <= 3:
+                        print(f"operation failed: {exc!r}", file=sys.stderr)
+                continue
+            if now >= measure_from:
+                latencies.append(time.perf_counter() - now)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - measure_from
+
+
+def report(
+    scenario: str,
+    latencies: list[float],
+    errors: int,
+    elapsed: float,
+    **extra: float,
+) -> None:
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100)
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    result = Result(
+        scenario=scenario,
+        ops=len(latencies),
+        errors=errors,
+        duration_s=round(elapsed, 3),
+        throughput=round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        p50_ms=round(p50 * 1000, 2),
+        p95_ms=round(p95 * 1000, 2),
+        p99_ms=round(p99 * 1000, 2),
+        max_rss_mb=round(max_rss_mb(), 1),
+        extra={key: round(value, 2) for key, value in extra.items()},
+    )
+    print(RESULT_PREFIX + json.dumps(asdict(result)), flush=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def base_env() -> None:
+    """Defaults every service's Settings needs; real values win if already exported."""
+    defaults = {
+        "MINIO_ACCESS_KEY": "bench",
+        "MINIO_SECRET_KEY": "bench-secret",
+        "MINIO_BUCKET_NAME": BUCKET,
+        "DOWNLOAD_TOKEN_SECRET": "bench-download-secret",
+        "JWT_SECRET": "bench-jwt-secret",
+        "RESEND_API_KEY": "re_bench",
+        "GATEWAY_EXTERNAL_URL": "http://gateway.bench",
+        "TRACING_EXPORTER": "none",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        # Stand-ins run on loopback; keep any HTTP(S)_PROXY from intercepting them.
+        "NO_PROXY": "127.0.0.1,localhost",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+@contextlib.contextmanager
+def s3_stand_in() -> Any:
+    """A local moto S3 server with the bucket created; exports MINIO_URL for the service."""
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    port = free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    endpoint = f"http://127.0.0.1:{port}"
+    os.environ["MINIO_URL"] = endpoint
+    s3 = boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id=os.environ["MINIO_ACCESS_KEY"],
+        aws_secret_access_key=os.environ["MINIO_SECRET_KEY"],
+        region_name="us-east-1",
+    )
+    s3.create_bucket(Bucket=BUCKET)
+    try:
+        yield s3
+    finally:
+        server.stop()
+
+
+def make_audio(path: Path, seconds: float) -> Path:
+    """Render a stereo 44.1 kHz 440 Hz tone as WAV with ffmpeg's lavfi source."""
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=440:sample_rate=44100:duration={seconds}",
+            "-ac",
+            "2",
+            str(path),
+        ],
+        check=True,
+    )
+    return path
+
+
+@contextlib.asynccontextmanager
+async def media_origin(directory: Path, latency_ms: float = 0) -> AsyncIterator[str]:
+    """Serve ``directory`` over HTTP with Range, ETag and Last-Modified (aiohttp's
+    FileResponse), optionally delaying every response. Yields the base URL."""
+    from aiohttp import web
+
+    async def serve(request: web.Request) -> web.StreamResponse:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        path = directory / request.match_info["name"]
+        if not path.is_file():
+            raise web.HTTPNotFound
+        return web.FileResponse(path)
+
+    app = web.Application()
+    app.router.add_get("/{name}", serve)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, host="127.0.0.1", port=port).start()
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
+
+
+class FakeExchange:
+    """Records what would have been published; ``latency_ms`` stands in for confirm time."""
+
+    def __init__(self, name: str = "", latency_ms: float = 0) -> None:
+        self.name = name
+        self.latency_ms = latency_ms
+        self.published: dict[str, int] = {}
+
+    async def publish(self, message: Any, routing_key: str, **_: Any) -> None:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        self.published[routing_key] = self.published.get(routing_key, 0) + 1
+
+
+class FakeQueue:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    async def bind(self, *_: Any, **__: Any) -> None:
+        return None
+
+
+class FakeChannel:
+    def __init__(self, latency_ms: float = 0) -> None:
+        self.default_exchange = FakeExchange(latency_ms=latency_ms)
+        self.exchanges: dict[str, FakeExchange] = {}
+
+    async def declare_queue(self, name: str = "", **_: Any) -> FakeQueue:
+        return FakeQueue(name)
+
+    async def declare_exchange(self, name: str, *_: Any, **__: Any) -> FakeExchange:
+        return self.exchanges.setdefault(name, FakeExchange(name))
+
+    async def set_qos(self, **_: Any) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+
+class FakeConnection:
+    """In-memory stand-in for an aio_pika robust connection."""
+
+    def __init__(self, latency_ms: float = 0) -> None:
+        self.latency_ms = latency_ms
+        self.channels: list[FakeChannel] = []
+
+    async def channel(self, **_: Any) -> FakeChannel:
+        channel = FakeChannel(self.latency_ms)
+        self.channels.append(channel)
+        return channel
+
+    async def close(self) -> None:
+        return None
+
+
+class FakeIncomingMessage:
+    """Just enough of ``aio_pika.abc.AbstractIncomingMessage`` for the consumers."""
+
+    def __init__(self, payload: dict[str, Any], headers: dict[str, Any] | None = None) -> None:
+        self.body = json.dumps(payload).encode()
+        self.headers = headers or {}
+        self.content_type = "application/json"
+        self.timestamp = datetime.now(tz=UTC)
+        self.outcome: str | None = None
+        self.settled = asyncio.Event()
+
+    def _settle(self, outcome: str) -> None:
+        if self.outcome is None:
+            self.outcome = outcome
+            self.settled.set()
+
+    async def ack(self) -> None:
+        self._settle("ack")
+
+    async def nack(self, requeue: bool = True) -> None:
+        self._settle("requeue" if requeue else "reject")
+
+    async def reject(self, requeue: bool = False) -> None:
+        self._settle("requeue" if requeue else "reject")
+
+    @contextlib.asynccontextmanager
+    async def process(self, requeue: bool = False, **_: Any) -> AsyncIterator[None]:
+        try:
+            yield
+        except BaseException:
+            self._settle("requeue" if requeue else "reject")
+            raise
+        self._settle("ack")
@@ -0,0 +1,131 @@
+"""Run the benchmark scenarios and compare them with a saved baseline.
+
+Usage::
+
+    python bench/run.py                                  # every scenario
+    python bench/run.py worker_process -- --duration 30  # args after -- go to the scenarios
+    python bench/run.py --save-baseline                  # record this machine's numbers
+    python bench/run.py --python worker=src/worker/.venv/bin/python
+
+Each scenario runs in its own process with its service directory as the working directory,
+using that service's interpreter (``--python service=PATH``, default: this one). A scenario
+regresses when throughput drops, or p95 latency or peak RSS grows, by more than
+``--tolerance`` against the baseline; the exit status is then 1. Baselines are only
+meaningful on the machine that recorded them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SRC_DIR = BENCH_DIR.parent / "src"
+RESULT_PREFIX = "BENCH_RESULT "
+
+# name -> (service, script, extra args)
+SCENARIOS: dict[str, tuple[str, str, list[str]]] = {
+    "gateway_login": ("gateway", "gateway_login.py", []),
+    "gateway_convert": ("gateway", "gateway_convert.py", []),
+    "gateway_download": ("gateway", "gateway_download.py", []),
+    "worker_process": ("worker", "worker_process.py", []),
+    "notification_consume": ("notification", "notification_consume.py", []),
+    "notification_batched": ("notification", "notification_consume.py", ["--batched", "1"]),
+}
+# (metric, True if higher is better)
+COMPARED = [("throughput", True), ("p95_ms", False), ("max_rss_mb", False)]
+
+
+def _run_scenario(name: str, python: str, extra_args: list[str]) -> dict[str, object] | None:
+    service, script, args = SCENARIOS[name]
+    cwd = SRC_DIR / service
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(BENCH_DIR), str(cwd)])}
+    proc = subprocess.run(
+        [python, str(BENCH_DIR / "scenarios" / script), *args, *extra_args],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+        check=False,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line.removeprefix(RESULT_PREFIX))
+    print(f"{name}: no result (exit status {proc.returncode})", file=sys.stderr)
+    return None
+
+
+def _compare(
+    result: dict[str, object], baseline: dict[str, object] | None, tolerance: float
+) -> list[str]:
+    if baseline is None:
+        return []
+    regressions = []
+    for metric, higher_is_better in COMPARED:
+        now, then = float(result[metric]), float(baseline[metric])  # type: ignore[arg-type]
+        if then <= 0:
+            continue
+        change = (now - then) / then
+        if (higher_is_better and change < -tolerance) or (
+            not higher_is_better and change > tolerance
+        ):
+            regressions.append(f"{metric} {then:g} -> {now:g} ({change:+.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO", help=", ".join(SCENARIOS))
+    parser.add_argument("--baseline", type=Path, default=BENCH_DIR / "baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument(
+        "--python", action="append", default=[], metavar="SERVICE=PATH", help="per-service python"
+    )
+    parser.add_argument("--output", type=Path, help="write all results as JSON")
+    argv = sys.argv[1:]
+    split = argv.index("--") if "--" in argv else len(argv)
+    args, extra_args = parser.parse_args(argv[:split]), argv[split + 1 :]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    pythons = dict(item.split("=", 1) for item in args.python)
+    baseline: dict[str, dict[str, object]] = (
+        json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    )
+    results: dict[str, dict[str, object]] = {}
+    failed = False
+
+    for name in args.scenarios or SCENARIOS:
+        service = SCENARIOS[name][0]
+        result = _run_scenario(name, pythons.get(service, sys.executable), extra_args)
+        if result is None:
+            failed = True
+            continue
+        results[name] = result
+        regressions = _compare(result, baseline.get(name), args.tolerance)
+        failed = failed or bool(regressions) or bool(result["errors"])
+        status = "REGRESSED" if regressions else ("new" if name not in baseline else "ok")
+        print(
+            f"{name:<22} {result['throughput']:>9.1f}/s  p50 {result['p50_ms']:>8.1f} ms  "
+            f"p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+            f"rss {result['max_rss_mb']:>6.1f} MB  errors {result['errors']}  {status}"
+        )
+        for regression in regressions:
+            print(f"    {regression}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    if args.save_baseline and results:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2) + "\n")
+        print(f"baseline saved to {args.baseline}")
+    sys.exit(1 if failed and not args.save_baseline else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""POST /convert/mp3 on the gateway with an in-memory publisher and stubbed upstreams.
+
+The broker is replaced by a publisher that waits ``--confirm-ms`` per call (a publisher
+confirm round trip); auth's /validate is answered by an httpx mock transport after
+``--upstream-ms``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+from typing import Any
+
+import httpx
+import jwt
+
+from common import base_env, drive, parse_args, report
+
+MEDIA_URL = "http://media.bench/clip.wav"
+
+
+class FakePublisher:
+    def __init__(self, confirm_ms: float) -> None:
+        self.confirm_ms = confirm_ms
+        self.published = 0
+
+    async def publish_many(
+        self, routing_key: str, payloads: list[dict[str, Any]], *, exchange: str = ""
+    ) -> None:
+        await asyncio.sleep(self.confirm_ms / 1000)
+        self.published += len(payloads)
+
+    async def publish(
+        self, routing_key: str, payload: dict[str, Any], *, exchange: str = ""
+    ) -> None:
+        await self.publish_many(routing_key, [payload], exchange=exchange)
+
+
+def _upstream(upstream_ms: float) -> httpx.AsyncClient:
+    async def handle(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(upstream_ms / 1000)
+        if request.url.path.endswith("/validate"):
+            return httpx.Response(
+                200,
+                json={"valid": True, "user_id": 1, "email": "bench@example.com", "name": "Bench"},
+            )
+        return httpx.Response(404)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handle))
+
+
+async def _run(args: argparse.Namespace) -> None:
+    import main
+    from config import settings
+    from job_status import create_job_store
+
+    app = main.app
+    publisher = FakePublisher(args.confirm_ms)
+    upstream = _upstream(args.upstream_ms)
+    app.state.http_client = upstream
+    app.state.publisher = publisher
+    app.state.job_store = create_job_store()
+
+    expires = dt.datetime.now(tz=dt.UTC) + dt.timedelta(hours=1)
+    token = jwt.encode(
+        {"sub": "1", "email": "bench@example.com", "exp": expires},
+        settings.jwt_secret,
+        algorithm=settings.jwt_algorithm,
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://gateway"
+    ) as gateway:
+
+        async def convert() -> None:
+            resp = await gateway.post(
+                "/convert/mp3", json={"url": MEDIA_URL, "profile": "standard"}, headers=headers
+            )
+            resp.raise_for_status()
+
+        latencies, errors, elapsed = await drive(
+            convert, concurrency=args.concurrency, duration=args.duration, warmup=args.warmup
+        )
+    await upstream.aclose()
+    report("gateway_convert", latencies, errors, elapsed, messages=publisher.published)
+
+
+def main() -> None:
+    args = parse_args(__doc__.splitlines()[0], concurrency=64, confirm_ms=2.0, upstream_ms=5.0)
+    base_env()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
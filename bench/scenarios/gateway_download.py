@@ -0,0 +1,73 @@
+"""GET /download/{token} on the gateway, streaming an object from a local moto S3 server."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import os
+
+import httpx
+import jwt
+
+from common import BUCKET, base_env, drive, parse_args, report, s3_stand_in
+
+FILE_KEY = "bench@example.com/bench.mp3"
+
+
+async def _run(args: argparse.Namespace) -> None:
+    import main
+    from config import settings
+    from s3_client import create_presign_client, create_s3_client
+
+    app = main.app
+    app.state.s3_client = create_s3_client()
+    app.state.presign_client = create_presign_client()
+
+    expires = dt.datetime.now(tz=dt.UTC) + dt.timedelta(hours=1)
+    token = jwt.encode(
+        {"sub": "bench@example.com", "file_key": FILE_KEY, "exp": expires},
+        settings.download_token_secret,
+        algorithm="HS256",
+    )
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://gateway"
+    ) as gateway:
+
+        async def download() -> None:
+            async with gateway.stream("GET", f"/download/{token}") as resp:
+                resp.raise_for_status()
+                async for _ in resp.aiter_bytes():
+                    pass
+
+        latencies, errors, elapsed = await drive(
+            download, concurrency=args.concurrency, duration=args.duration, warmup=args.warmup
+        )
+    report(
+        "gateway_download",
+        latencies,
+        errors,
+        elapsed,
+        object_mb=args.size_mb,
+        mb_per_s=len(latencies) * args.size_mb / elapsed,
+    )
+
+
+def main() -> None:
+    args = parse_args(__doc__.splitlines()[0], concurrency=8, size_mb=8)
+    base_env()
+    # This scenario measures proxying, not redirects.
+    os.environ["DOWNLOAD_MODE"] = "stream"
+    with s3_stand_in() as s3:
+        s3.put_object(
+            Bucket=BUCKET,
+            Key=FILE_KEY,
+            Body=os.urandom(args.size_mb * 1024 * 1024),
+            ContentType="audio/mpeg",
+        )
+        asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""POST /auth/login through the gateway to a real auth service backed by SQLite.
+
+Auth runs as a uvicorn subprocess (``--auth-python`` selects the interpreter with auth's
+dependencies); the gateway app runs in-process behind httpx's ASGI transport.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from common import REPO_ROOT, base_env, drive, free_port, parse_args, report
+
+AUTH_DIR = REPO_ROOT / "src" / "auth"
+EMAIL = "bench@example.com"
+PASSWORD = "bench-password"  # noqa: S105
+
+
+def _start_auth(python: str, workdir: Path, rounds: int) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{workdir / 'auth.db'}",
+        "BCRYPT_ROUNDS": str(rounds),
+        "PYTHONPATH": str(AUTH_DIR),
+    }
+    subprocess.run(
+        [
+            python,
+            "-c",
+            "import models; from sqlmodel import SQLModel, create_engine; "
+            f"SQLModel.metadata.create_all(create_engine('sqlite:///{workdir / 'auth.db'}'))",
+        ],
+        cwd=AUTH_DIR,
+        env=env,
+        check=True,
+    )
+    proc = subprocess.Popen(
+        [python, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=AUTH_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    return proc, f"http://127.0.0.1:{port}"
+
+
+async def _wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(f"{url}/docs")
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+
+async def _run(args: argparse.Namespace) -> None:
+    import main
+    from proxy import create_http_client
+
+    app = main.app
+    upstream = create_http_client()
+    app.state.http_client = upstream
+    credentials = base64.b64encode(f"{EMAIL}:{PASSWORD}".encode()).decode()
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://gateway"
+    ) as gateway:
+        resp = await gateway.post(
+            "/auth/register",
+            json={"name": "Bench", "email": EMAIL, "password": PASSWORD, "age": 30},
+        )
+        if resp.status_code not in (200, 201, 409):
+            raise RuntimeError(f"register failed: {resp.status_code} {resp.text}")
+
+        async def login() -> None:
+            resp = await gateway.post(
+                "/auth/login", headers={"Authorization": f"Basic {credentials}"}
+            )
+            resp.raise_for_status()
+
+        latencies, errors, elapsed = await drive(
+            login, concurrency=args.concurrency, duration=args.duration, warmup=args.warmup
+        )
+    await upstream.aclose()
+    report("gateway_login", latencies, errors, elapsed, bcrypt_rounds=args.rounds)
+
+
+def main() -> None:
+    args = parse_args(__doc__.splitlines()[0], auth_python=sys.executable, rounds=10)
+    base_env()
+    with tempfile.TemporaryDirectory(prefix="bench-auth-") as workdir:
+        proc, url = _start_auth(args.auth_python, Path(workdir), args.rounds)
+        os.environ["AUTH_SERVICE_URL"] = url
+        try:
+            asyncio.run(_wait_ready(url))
+            asyncio.run(_run(args))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
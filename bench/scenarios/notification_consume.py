@@ -0,0 +1,87 @@
+"""The notification consumer against a Resend stub that answers after ``--resend-ms``.
+
+``--batched 1`` goes through EmailBatcher and Resend's batch endpoint; latency is then
+measured until the message is acked, which includes the batch linger.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+
+import httpx
+
+from common import FakeIncomingMessage, base_env, drive, parse_args, report
+
+
+def _resend_stub(resend_ms: float, calls: dict[str, int]) -> httpx.AsyncClient:
+    from config import settings
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(resend_ms / 1000)
+        calls[request.url.path] = calls.get(request.url.path, 0) + 1
+        if request.url.path == "/emails/batch":
+            return httpx.Response(200, json={"data": []})
+        return httpx.Response(200, json={"id": "bench"})
+
+    return httpx.AsyncClient(
+        base_url=settings.resend_base_url,
+        headers={"Authorization": f"Bearer {settings.resend_api_key}"},
+        transport=httpx.MockTransport(handle),
+    )
+
+
+async def _run(args: argparse.Namespace) -> None:
+    from config import settings
+    from main import process_message, process_message_batched
+    from mailer import EmailBatcher
+
+    calls: dict[str, int] = {}
+    client = _resend_stub(args.resend_ms, calls)
+    batcher = (
+        EmailBatcher(client, settings.batch_size, settings.batch_linger_ms / 1000)
+        if args.batched
+        else None
+    )
+    slots = asyncio.Semaphore(settings.max_concurrent_sends)
+    payload = {
+        "name": "Bench",
+        "email": "bench@example.com",
+        "file_key": "bench@example.com/bench.mp3",
+    }
+
+    async def consume() -> None:
+        message = FakeIncomingMessage(payload)
+        if batcher is not None:
+            await process_message_batched(message, batcher)
+        else:
+            await process_message(message, client, slots)
+        await message.settled.wait()
+        if message.outcome != "ack":
+            raise RuntimeError(f"message was {message.outcome}")
+
+    latencies, errors, elapsed = await drive(
+        consume, concurrency=args.concurrency, duration=args.duration, warmup=args.warmup
+    )
+    if batcher is not None:
+        await batcher.close()
+    await client.aclose()
+    report(
+        "notification_batched" if args.batched else "notification_consume",
+        latencies,
+        errors,
+        elapsed,
+        resend_calls=sum(calls.values()),
+    )
+
+
+def main() -> None:
+    args = parse_args(__doc__.splitlines()[0], concurrency=64, resend_ms=50.0, batched=0)
+    base_env()
+    os.environ.setdefault("MAX_CONCURRENT_SENDS", "16")
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
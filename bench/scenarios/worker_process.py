@@ -0,0 +1,98 @@
+"""The worker's process_message end to end: download from a local media origin, ffmpeg, upload
+to a local moto S3 server, with an in-memory AMQP connection.
+
+Each operation is one job with a fresh job ID. ``--cache 1`` enables the conversion cache
+(every job then converts the same source, so this measures the cache hit path).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import uuid
+from pathlib import Path
+
+from common import (
+    FakeConnection,
+    FakeIncomingMessage,
+    base_env,
+    drive,
+    make_audio,
+    max_rss_mb,
+    media_origin,
+    parse_args,
+    report,
+    s3_stand_in,
+)
+
+
+async def _run(args: argparse.Namespace, media_dir: Path) -> None:
+    from config import settings
+    from main import process_message
+    from resources import open_resources
+    from scheduling import INTERACTIVE
+
+    connection = FakeConnection(latency_ms=args.confirm_ms)
+    async with (
+        media_origin(media_dir, args.origin_ms) as origin,
+        open_resources(connection) as resources,
+    ):
+        url = f"{origin}/source.wav"
+
+        async def job() -> None:
+            message = FakeIncomingMessage(
+                {
+                    "job_id": uuid.uuid4().hex,
+                    "name": "Bench",
+                    "email": "bench@example.com",
+                    "url": url,
+                    "profile": args.profile,
+                }
+            )
+            await process_message(message, resources, INTERACTIVE, settings.audio_in_queue)
+
+        latencies, errors, elapsed = await drive(
+            job, concurrency=args.concurrency, duration=args.duration, warmup=args.warmup
+        )
+
+    published = connection.channels[0].default_exchange.published
+    failed = published.get(settings.dead_letter_queue, 0) + sum(
+        count for key, count in published.items() if ".retry." in key
+    )
+    report(
+        "worker_process",
+        latencies,
+        errors + failed,
+        elapsed,
+        audio_seconds=args.audio_seconds,
+        audio_seconds_per_s=len(latencies) * args.audio_seconds / elapsed,
+        ffmpeg_max_rss_mb=max_rss_mb(children=True),
+    )
+
+
+def main() -> None:
+    args = parse_args(
+        __doc__.splitlines()[0],
+        concurrency=4,
+        duration=20.0,
+        audio_seconds=60.0,
+        profile="standard",
+        streaming=1,
+        cache=0,
+        origin_ms=0.0,
+        confirm_ms=2.0,
+    )
+    base_env()
+    os.environ["STREAMING_PIPELINE"] = "true" if args.streaming else "false"
+    os.environ["CONVERSION_CACHE_ENABLED"] = "true" if args.cache else "false"
+    os.environ.setdefault("MAX_CONCURRENT_JOBS", str(args.concurrency))
+    with tempfile.TemporaryDirectory(prefix="bench-media-") as tmp, s3_stand_in():
+        media_dir = Path(tmp)
+        make_audio(media_dir / "source.wav", args.audio_seconds)
+        asyncio.run(_run(args, media_dir))
+
+
+if __name__ == "__main__":
+    main()
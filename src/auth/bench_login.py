@@ -0,0 +1,75 @@
+"""Measure password verification throughput, the CPU cost behind every /login.
+
+Usage::
+
+    BCRYPT_ROUNDS=12 HASH_WORKERS=4 python bench_login.py --concurrency 32 --duration 10
+
+Runs password verification through the same process pool and admission limit the service
+uses, configured from the same environment, and reports logins/s overall and per worker
+core, plus latency percentiles and how many requests were shed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from config import settings
+from security import HashingOverloadedError, HashPool
+
+
+async def _bench(pool: HashPool, concurrency: int, duration: float) -> tuple[list[float], int]:
+    hashed = await pool.hash_password("benchmark-password")
+    latencies: list[float] = []
+    shed = 0
+    deadline = time.perf_counter() + duration
+
+    async def client() -> None:
+        nonlocal shed
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                valid, _ = await pool.verify_password("benchmark-password", hashed)
+            except HashingOverloadedError:
+                shed += 1
+                await asyncio.sleep(0.01)
+                continue
+            assert valid
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, shed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    pool = HashPool()
+    try:
+        latencies, shed = asyncio.run(_bench(pool, args.concurrency, args.duration))
+    finally:
+        pool.shutdown()
+
+    if not latencies:
+        print("no successful logins")
+        return
+    workers = settings.hash_workers
+    throughput = len(latencies) / args.duration
+    cuts = statistics.quantiles(latencies, n=100)
+    p50, p95, p99 = cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+    print(f"bcrypt rounds:     {settings.bcrypt_rounds}")
+    print(f"workers:           {workers}")
+    print(f"concurrency:       {args.concurrency}")
+    print(f"logins/s:          {throughput:.1f}")
+    print(f"logins/s per core: {throughput / workers:.1f}")
+    print(f"p50/p95/p99 ms:    {p50:.1f} / {p95:.1f} / {p99:.1f}")
+    print(f"shed (overloaded): {shed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,33 @@
-from collections.abc import Iterator
+from collections.abc import AsyncIterator
+from typing import Any
 
-from sqlmodel import Session, create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from config import settings
 
-engine = create_engine(settings.database_url, echo=False, pool_pre_ping=True)
 
+def _pool_options(url: str) -> dict[str, Any]:
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+    }
 
-def get_session() -> Iterator[Session]:
-    with Session(engine) as session:
+
+# DATABASE_URL must name an async driver, e.g. postgresql+psycopg:// (psycopg 3 is async
+# capable) or sqlite+aiosqlite://.
+engine = create_async_engine(
+    settings.database_url, echo=False, pool_pre_ping=True, **_pool_options(settings.database_url)
+)
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    # Sessions connect lazily, so requests answered from the user cache never check out a
+    # connection.
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
@@ -1,42 +1,78 @@
 from __future__ import annotations
 
-from fastapi import Depends, FastAPI, Header, HTTPException, status
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, status
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import users
+from db import engine, get_session
+from logging_config import logger
+from metrics import MetricsMiddleware, metrics_endpoint
+from models import TokenResponse, UserCreate, ValidateResponse
+from security import (
+    HashingOverloadedError,
+    HashPool,
+    create_access_token,
+    decode_token,
+    get_hash_pool,
+)
+from tracing import setup_tracing
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Created before the first request, so before the engine opens any connections.
+    app.state.hash_pool = HashPool()
+    try:
+        yield
+    finally:
+        app.state.hash_pool.shutdown()
+        await engine.dispose()
+        if tracer_provider is not None:
+            tracer_provider.shutdown()
 
-from db import get_session
-from models import TokenResponse, User, UserCreate, ValidateResponse
-from security import create_access_token, decode_token, hash_password, verify_password
 
-app = FastAPI(title="Auth Service", version="0.1.0")
+app = FastAPI(title="Auth Service", version="0.1.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+tracer_provider = setup_tracing(app)
 
 security = HTTPBasic()
 
 
+@app.exception_handler(HashingOverloadedError)
+async def hashing_overloaded_handler(_: Request, __: HashingOverloadedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many concurrent password operations, retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
-def register(user_in: UserCreate, session: Session = Depends(get_session)) -> TokenResponse:
-    existing = session.exec(select(User).where(User.email == user_in.email)).first()
-    if existing is not None:
+async def register(
+    user_in: UserCreate,
+    session: AsyncSession = Depends(get_session),
+    hash_pool: HashPool = Depends(get_hash_pool),
+) -> TokenResponse:
+    if users.is_known_email(user_in.email):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already registered")
 
-    user = User(
+    user_id = await users.create(
+        session,
         name=user_in.name,
         email=user_in.email,
-        hashed_password=hash_password(user_in.password),
+        hashed_password=await hash_pool.hash_password(user_in.password),
         age=int(user_in.age),
     )
-
-    session.add(user)
-
-    try:
-        session.commit()
-    except IntegrityError:
-        session.rollback()
+    if user_id is None:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email already registered")
-    session.refresh(user)
 
-    token = create_access_token({"sub": str(user.id), "email": user.email})
+    token = create_access_token({"sub": str(user_id), "email": user_in.email})
     return TokenResponse(access_token=token)
 
 
@@ -45,23 +81,35 @@ def _parse_basic_credentials(credentials: HTTPBasicCredentials) -> tuple[str, st
 
 
 @app.post("/login", response_model=TokenResponse)
-def login(
+async def login(
     credentials: HTTPBasicCredentials = Depends(security),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
+    hash_pool: HashPool = Depends(get_hash_pool),
 ) -> TokenResponse:
     email, password = _parse_basic_credentials(credentials)
-    user = session.exec(select(User).where(User.email == email)).first()
-    if user is None or not verify_password(password, user.hashed_password):
+    user = await users.get_by_email(session, email)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    valid, new_hash = await hash_pool.verify_password(password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
+    if new_hash is not None:
+        # The configured bcrypt cost changed since this hash was made; upgrade it now that
+        # we have the plaintext. A failure here must not fail the login.
+        try:
+            await users.update_password(session, user, new_hash)
+        except Exception:
+            logger.warning(f"Failed to rehash password for user {user.id}", exc_info=True)
+
     token = create_access_token({"sub": str(user.id), "email": user.email})
     return TokenResponse(access_token=token)
 
 
 @app.post("/validate", response_model=ValidateResponse)
-def validate_token(
+async def validate_token(
     authorization: str | None = Header(default=None),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
 ) -> ValidateResponse:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing Bearer token")
@@ -72,7 +120,7 @@ def validate_token(
         email = payload.get("email")
         if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-        user = session.get(User, int(user_id))
+        user = await users.get_by_id(session, int(user_id))
         if user is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token user"
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the end of the response, by route template.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled.")
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware (not BaseHTTPMiddleware) so streamed responses are timed to their
+    last byte and nothing gets buffered."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; label by its template so
+            # path parameters don't explode the label set.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status_code)).observe(
+                time.perf_counter() - start
+            )
+
+
+# Time spent in bcrypt itself (measured in the pool process) and waiting for a pool worker.
+BCRYPT_SECONDS = Histogram(
+    "auth_bcrypt_seconds",
+    "bcrypt hash/verify time inside the hashing pool.",
+    ["op"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2, 5),
+)
+HASH_QUEUE_SECONDS = Histogram(
+    "auth_hash_queue_seconds",
+    "Time a password operation waited for a hashing pool worker.",
+    ["op"],
+)
+HASH_IN_FLIGHT = Gauge("auth_hash_in_flight", "Password operations admitted to the pool.")
+HASH_REJECTED = Counter(
+    "auth_hash_rejected_total", "Password operations shed because the hashing queue was full."
+)
+
+USER_CACHE = Counter("auth_user_cache_total", "User lookups by cache result.", ["result"])
+
+
+async def metrics_endpoint(_: Request) -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
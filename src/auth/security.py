@@ -1,20 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import UTC, datetime, timedelta
 from typing import Any
 
 import jwt
+from fastapi import Request
 from passlib.context import CryptContext
 
 from config import settings
+from metrics import BCRYPT_SECONDS, HASH_IN_FLIGHT, HASH_QUEUE_SECONDS, HASH_REJECTED
+from tracing import tracer
+
+# Pinning min and max rounds to the configured cost makes passlib flag every hash made with
+# a different cost as needing an update, which is what drives rehash-on-login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds,
+)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+class HashingOverloadedError(Exception):
+    """Raised when the password hashing queue is full and the request should be shed."""
 
-def hash_password(plain_password: str) -> str:
+
+def _hash_blocking(plain_password: str) -> str:
     return pwd_context.hash(plain_password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def _verify_blocking(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _timed(fn: Any, *args: Any) -> tuple[Any, float]:
+    # Runs in the pool process, so only the bcrypt call itself is measured.
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class HashPool:
+    """Process pool for bcrypt, so hashing doesn't block the event loop.
+
+    Admission control: operations waiting for a worker are capped at HASH_QUEUE_LIMIT;
+    beyond that we shed load instead of queueing requests in memory for seconds.
+    """
+
+    def __init__(self, max_workers: int | None = None) -> None:
+        # Workers start on demand inside a running server with threads and open connections,
+        # which fork must not copy; forkserver starts them from a clean, single-threaded process.
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers or settings.hash_workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        self._in_flight = 0
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    async def _run(self, op: str, fn: Any, *args: Any) -> Any:
+        if self._in_flight >= settings.hash_queue_limit:
+            HASH_REJECTED.inc()
+            raise HashingOverloadedError
+        self._in_flight += 1
+        HASH_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            with tracer.start_as_current_span(f"bcrypt {op}") as span:
+                result, bcrypt_seconds = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, _timed, fn, *args
+                )
+                span.set_attribute("app.bcrypt_seconds", bcrypt_seconds)
+        finally:
+            self._in_flight -= 1
+            HASH_IN_FLIGHT.dec()
+        BCRYPT_SECONDS.labels(op).observe(bcrypt_seconds)
+        HASH_QUEUE_SECONDS.labels(op).observe(
+            max(0.0, time.perf_counter() - start - bcrypt_seconds)
+        )
+        return result
+
+    async def hash_password(self, plain_password: str) -> str:
+        return await self._run("hash", _hash_blocking, plain_password)
+
+    async def verify_password(
+        self, plain_password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """Verify a password; the second item is a replacement hash when the cost has changed."""
+        return await self._run("verify", _verify_blocking, plain_password, hashed_password)
+
+
+def get_hash_pool(request: Request) -> HashPool:
+    return request.app.state.hash_pool
 
 
 def create_access_token(claims: dict[str, Any], expires_delta: timedelta | None = None) -> str:
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from fastapi import FastAPI
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+from config import settings
+from logging_config import logger
+
+tracer = trace.get_tracer("auth")
+
+
+def _exporter() -> SpanExporter | None:
+    if settings.tracing_exporter == "otlp":
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables.
+        return OTLPSpanExporter()
+    if settings.tracing_exporter == "file":
+        out = open(settings.tracing_file, "a")  # noqa: SIM115, PTH123
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    return None
+
+
+def setup_tracing(app: FastAPI) -> TracerProvider | None:
+    """Install the global tracer provider; spans are dropped when TRACING_EXPORTER is none."""
+    exporter = _exporter()
+    if exporter is None:
+        return None
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "auth"}),
+        sampler=ParentBased(TraceIdRatioBased(settings.tracing_sample_ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics")
+    logger.info(f"Tracing enabled ({settings.tracing_exporter})")
+    return provider
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from config import settings
+from db import engine
+from metrics import USER_CACHE
+from models import User
+from ttl_cache import TTLCache
+
+# INSERT ... ON CONFLICT is dialect specific in SQLAlchemy.
+_INSERTS: dict[str, Any] = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+@dataclass(frozen=True, slots=True)
+class CachedUser:
+    """Immutable snapshot of a users row, safe to share between requests."""
+
+    id: int
+    name: str
+    email: str
+    hashed_password: str
+
+
+_cache: TTLCache[CachedUser] = TTLCache(
+    maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl_seconds
+)
+
+
+def _remember(user: User) -> CachedUser:
+    cached = CachedUser(
+        id=user.id, name=user.name, email=user.email, hashed_password=user.hashed_password
+    )
+    _cache.set(f"id:{cached.id}", cached)
+    _cache.set(f"email:{cached.email}", cached)
+    return cached
+
+
+def _forget(user: CachedUser) -> None:
+    _cache.pop(f"id:{user.id}")
+    _cache.pop(f"email:{user.email}")
+
+
+def _cached(key: str) -> CachedUser | None:
+    user = _cache.get(key)
+    USER_CACHE.labels("hit" if user is not None else "miss").inc()
+    return user
+
+
+def is_known_email(email: str) -> bool:
+    """Cache-only check, so duplicate registrations can be refused before hashing."""
+    return _cache.get(f"email:{email}") is not None
+
+
+async def get_by_id(session: AsyncSession, user_id: int) -> CachedUser | None:
+    cached = _cached(f"id:{user_id}")
+    if cached is not None:
+        return cached
+    user = await session.get(User, user_id)
+    return _remember(user) if user is not None else None
+
+
+async def get_by_email(session: AsyncSession, email: str) -> CachedUser | None:
+    cached = _cached(f"email:{email}")
+    if cached is not None:
+        return cached
+    user = (await session.exec(select(User).where(User.email == email))).first()
+    return _remember(user) if user is not None else None
+
+
+async def create(
+    session: AsyncSession, *, name: str, email: str, hashed_password: str, age: int
+) -> int | None:
+    """Insert a user in one round trip; returns the new id, or None if the email is taken."""
+    stmt = (
+        _INSERTS[engine.dialect.name](User)
+        .values(
+            name=name,
+            email=email,
+            hashed_password=hashed_password,
+            age=age,
+            created_at=datetime.now(),
+        )
+        .on_conflict_do_nothing(index_elements=["email"])
+        .returning(User.id)  # type: ignore[arg-type]
+    )
+    user_id = (await session.execute(stmt)).scalar_one_or_none()
+    await session.commit()
+    _cache.pop(f"email:{email}")
+    return user_id
+
+
+async def update_password(session: AsyncSession, user: CachedUser, hashed_password: str) -> None:
+    stmt = (
+        update(User)
+        .where(User.id == user.id)  # type: ignore[arg-type]
+        .values(hashed_password=hashed_password)
+    )
+    await session.execute(stmt)
+    await session.commit()
+    _forget(user)
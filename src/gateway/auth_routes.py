@@ -1,23 +1,30 @@
-from fastapi import APIRouter, Header
+from fastapi import APIRouter, Header, Request
 
 from config import settings
 from proxy import forward_request
 
 router = APIRouter()
 
+# The body and header parameters are declared for validation and the OpenAPI schema; the
+# request itself is forwarded as received.
+
 
 @router.post("/register")
-async def register(user: dict):
-    return await forward_request("POST", f"{settings.auth_service_url}/register", data=user)
+async def register(request: Request, user: dict):
+    return await forward_request(
+        request, f"{settings.auth_service_url}/register", timeout=settings.auth_timeout
+    )
 
 
 @router.post("/login")
-async def login(authorization: str = Header(...)):
-    headers = {"Authorization": authorization}
-    return await forward_request("POST", f"{settings.auth_service_url}/login", headers=headers)
+async def login(request: Request, authorization: str = Header(...)):
+    return await forward_request(
+        request, f"{settings.auth_service_url}/login", timeout=settings.auth_timeout
+    )
 
 
 @router.post("/validate")
-async def validate(authorization: str = Header(...)):
-    headers = {"Authorization": authorization}
-    return await forward_request("POST", f"{settings.auth_service_url}/validate", headers=headers)
+async def validate(request: Request, authorization: str = Header(...)):
+    return await forward_request(
+        request, f"{settings.auth_service_url}/validate", timeout=settings.validate_timeout
+    )
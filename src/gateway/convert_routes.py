@@ -1,79 +1,201 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from typing import Any
+import time
+import uuid
+from collections.abc import AsyncIterator
+from typing import Annotated, Any
 
-import aio_pika
 import httpx
-from fastapi import APIRouter, Body, Header, HTTPException, status
-from pydantic import AnyHttpUrl, BaseModel
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
+from pydantic import AnyHttpUrl, BaseModel, Field
 
 from config import settings
+from job_status import TERMINAL_STAGES, JobState, JobStatusStore, get_job_store
+from logging_config import logger
+from principals import resolve_principal
+from proxy import get_http_client
+from publisher import QueuePublisher, get_publisher
 
 router = APIRouter()
 
 
+# Encoding profile name. The worker's table (worker/profiles.py) is the only list of profiles
+# and fails jobs that name an unknown one; None leaves the choice to the worker's default.
+EncodingProfileName = Annotated[str, Field(pattern=r"^[a-z0-9_-]{1,32}$")] | None
+
+
 class ConvertMp3Request(BaseModel):
     url: AnyHttpUrl
+    profile: EncodingProfileName = None
+    # Source size in bytes if the client knows it; only used to pick the queue.
+    size_hint: int | None = Field(default=None, ge=0)
 
 
-async def _validate_user(authorization: str | None) -> dict[str, Any]:
-    if not authorization:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing Authorization header"
-        )
+class ConvertMp3BatchRequest(BaseModel):
+    urls: list[AnyHttpUrl] = Field(min_length=1, max_length=settings.batch_max_urls)
+    profile: EncodingProfileName = None
+    # Produce one zip of all results and a single notification instead of one per URL.
+    zip_on_completion: bool = False
 
-    async with httpx.AsyncClient(timeout=settings.request_timeout) as client:
-        try:
-            response = await client.post(
-                f"{settings.auth_service_url}/validate",
-                headers={"Authorization": authorization},
-            )
-            response.raise_for_status()
-            data = response.json()
-            if not data.get("valid"):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
-                )
-            return data
-        except httpx.HTTPStatusError as exc:
-            raise HTTPException(status_code=exc.response.status_code, detail=exc.response.json())
-        except httpx.RequestError:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Auth unavailable"
-            )
+
+def _queue_for(size_hint: int | None) -> str:
+    """Pick the queue for a single job from the size the client says the source has.
+
+    The gateway never fetches user URLs itself. Without a hint the job is interactive; a
+    worker that finds the source is large after all moves it to the bulk queue.
+    """
+    if settings.bulk_threshold_bytes > 0 and (size_hint or 0) >= settings.bulk_threshold_bytes:
+        return settings.audio_in_bulk_queue
+    return settings.audio_in_queue
 
 
 @router.post("/mp3", status_code=status.HTTP_202_ACCEPTED)
 async def convert_mp3(
     payload: ConvertMp3Request = Body(...),
     authorization: str | None = Header(default=None),
+    publisher: QueuePublisher = Depends(get_publisher),
+    client: httpx.AsyncClient = Depends(get_http_client),
+    store: JobStatusStore = Depends(get_job_store),
 ):
-    user = await _validate_user(authorization)
+    user = await resolve_principal(client, authorization)
 
+    job_id = uuid.uuid4().hex
     message = {
+        "job_id": job_id,
         "name": user.get("name"),
         "email": user.get("email"),
         "url": str(payload.url),
+        "profile": payload.profile,
     }
 
+    queue = _queue_for(payload.size_hint)
     try:
-        connection = await aio_pika.connect_robust(settings.rabbitmq_url)
-    except Exception:
+        await publisher.publish(queue, message)
+    except Exception as exc:
+        logger.error(f"Failed to enqueue conversion: {exc}")
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Queue unavailable"
         )
 
-    async with connection:
-        channel = await connection.channel()
-        await channel.declare_queue(settings.audio_in_queue, durable=True)
-        await channel.default_exchange.publish(
-            aio_pika.Message(
-                body=json.dumps(message).encode(),
-                content_type="application/json",
-                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-            ),
-            routing_key=settings.audio_in_queue,
+    await _announce_queued(publisher, store, [job_id], user.get("email"))
+    return {"status": "queued", "job_id": job_id}
+
+
+@router.post("/mp3/batch", status_code=status.HTTP_202_ACCEPTED)
+async def convert_mp3_batch(
+    payload: ConvertMp3BatchRequest = Body(...),
+    authorization: str | None = Header(default=None),
+    publisher: QueuePublisher = Depends(get_publisher),
+    client: httpx.AsyncClient = Depends(get_http_client),
+    store: JobStatusStore = Depends(get_job_store),
+):
+    user = await resolve_principal(client, authorization)
+
+    urls = list(dict.fromkeys(str(url) for url in payload.urls))
+    batch_id = uuid.uuid4().hex
+    messages = []
+    for url in urls:
+        message = {
+            "job_id": uuid.uuid4().hex,
+            "name": user.get("name"),
+            "email": user.get("email"),
+            "url": url,
+            "profile": payload.profile,
+        }
+        if payload.zip_on_completion:
+            message |= {"batch_id": batch_id, "batch_size": len(urls), "zip_on_completion": True}
+        messages.append(message)
+
+    # One confirmed batch: either the broker acknowledges every message or the caller gets a
+    # 503 and can resubmit. Batches are bulk work by definition.
+    try:
+        await publisher.publish_many(settings.audio_in_bulk_queue, messages)
+    except Exception as exc:
+        logger.error(f"Failed to enqueue conversion batch: {exc}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Queue unavailable"
         )
 
-    return {"status": "queued"}
+    await _announce_queued(publisher, store, [m["job_id"] for m in messages], user.get("email"))
+    return {
+        "status": "queued",
+        "batch_id": batch_id,
+        "zip_on_completion": payload.zip_on_completion,
+        "duplicates_removed": len(payload.urls) - len(urls),
+        "jobs": [{"url": m["url"], "job_id": m["job_id"]} for m in messages],
+    }
+
+
+async def _announce_queued(
+    publisher: QueuePublisher, store: JobStatusStore, job_ids: list[str], email: str | None
+) -> None:
+    events = [
+        {"job_id": job_id, "status": "queued", "email": email, "at": time.time()}
+        for job_id in job_ids
+    ]
+    # Record locally first so an immediate poll on this replica sees the job, then fan out
+    # to the other replicas. Status is best effort; the job itself is already enqueued.
+    for event in events:
+        store.apply(event)
+    try:
+        await publisher.publish_many("", events, exchange=settings.job_status_exchange)
+    except Exception as exc:
+        logger.warning(f"Failed to publish queued status: {exc}")
+
+
+async def _owned_job(
+    job_id: str, authorization: str | None, client: httpx.AsyncClient, store: JobStatusStore
+) -> JobState:
+    user = await resolve_principal(client, authorization)
+    state = store.get(job_id)
+    # Unknown and foreign jobs look the same so job IDs can't be probed.
+    if state is None or state.owner != user.get("email"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return state
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    authorization: str | None = Header(default=None),
+    client: httpx.AsyncClient = Depends(get_http_client),
+    store: JobStatusStore = Depends(get_job_store),
+) -> dict[str, Any]:
+    state = await _owned_job(job_id, authorization, client, store)
+    return state.to_public()
+
+
+def _sse(state: JobState) -> bytes:
+    return f"event: status\ndata: {json.dumps(state.to_public())}\n\n".encode()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job(
+    job_id: str,
+    authorization: str | None = Header(default=None),
+    client: httpx.AsyncClient = Depends(get_http_client),
+    store: JobStatusStore = Depends(get_job_store),
+) -> StreamingResponse:
+    state = await _owned_job(job_id, authorization, client, store)
+
+    async def events() -> AsyncIterator[bytes]:
+        with store.subscribe(job_id) as updates:
+            current = state
+            yield _sse(current)
+            while current.status not in TERMINAL_STAGES:
+                try:
+                    current = await asyncio.wait_for(updates.get(), settings.job_status_heartbeat)
+                except TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream.
+                    yield b": keep-alive\n\n"
+                    continue
+                yield _sse(current)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
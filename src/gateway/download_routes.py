@@ -1,27 +1,22 @@
 from __future__ import annotations
 
 import datetime as dt
+import mimetypes
+from collections.abc import AsyncIterator
 from typing import Any
 
-import boto3
 import jwt
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 from config import settings
+from s3_client import get_presign_client, get_s3_client
 
 router = APIRouter()
 
 
-def get_s3_client() -> Any:
-    return boto3.client(
-        "s3",
-        endpoint_url=settings.minio_url,
-        aws_access_key_id=settings.minio_access_key,
-        aws_secret_access_key=settings.minio_secret_key,
-    )
-
-
 @router.post("/generate-token")
 def generate_download_token(payload: dict[str, str]) -> dict[str, str]:
     email = payload.get("email")
@@ -35,8 +30,7 @@ def generate_download_token(payload: dict[str, str]) -> dict[str, str]:
     return {"token": token}
 
 
-@router.get("/{token}")
-def download_file(token: str, s3_client: Any = Depends(get_s3_client)) -> StreamingResponse:
+def _authorized_file_key(token: str) -> str:
     try:
         decoded = jwt.decode(
             token,
@@ -55,22 +49,121 @@ def download_file(token: str, s3_client: Any = Depends(get_s3_client)) -> Stream
 
     if not file_key.startswith(f"{user_email}/"):
         raise HTTPException(status_code=403, detail="Not authorized for this file")
+    return file_key
 
-    try:
-        obj = s3_client.get_object(Bucket=settings.minio_bucket_name, Key=file_key)
-    except s3_client.exceptions.NoSuchKey:  # type: ignore[attr-defined]
-        raise HTTPException(status_code=404, detail="File not found")
 
-    content_type = obj.get("ContentType") or "application/octet-stream"
-    filename = file_key.split("/")[-1]
+def _error_code(exc: ClientError) -> str:
+    return str(exc.response.get("Error", {}).get("Code", ""))
+
 
-    def stream_body():
-        body = obj["Body"]
+def _content_disposition(file_key: str) -> str:
+    filename = file_key.rsplit("/", maxsplit=1)[-1]
+    return f'attachment; filename="{filename}"'
+
+
+def _content_type(file_key: str) -> str:
+    # Redirects never see the stored object, so derive its type from the key (.mp3 or .zip).
+    return mimetypes.guess_type(file_key)[0] or "application/octet-stream"
+
+
+def _presigned_redirect(presign_client: Any, file_key: str) -> RedirectResponse:
+    # Signing is a local HMAC computation, no round trip to MinIO.
+    url = presign_client.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": settings.minio_bucket_name,
+            "Key": file_key,
+            "ResponseContentDisposition": _content_disposition(file_key),
+            "ResponseContentType": _content_type(file_key),
+        },
+        ExpiresIn=settings.presigned_url_ttl,
+    )
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+
+
+def _object_headers(obj: dict[str, Any], file_key: str) -> dict[str, str]:
+    headers = {
+        "Content-Disposition": _content_disposition(file_key),
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(obj["ContentLength"]),
+    }
+    if obj.get("ETag"):
+        headers["ETag"] = obj["ETag"]
+    if obj.get("LastModified"):
+        headers["Last-Modified"] = obj["LastModified"].strftime("%a, %d %b %Y %H:%M:%S GMT")
+    if obj.get("ContentRange"):
+        headers["Content-Range"] = obj["ContentRange"]
+    return headers
+
+
+async def _iter_body(body: Any) -> AsyncIterator[bytes]:
+    # Each read hops to the threadpool and back, so a slow client holds no thread while
+    # its socket drains; only the blocking read itself occupies one.
+    try:
         while True:
-            chunk = body.read(8192)
+            chunk = await run_in_threadpool(body.read, settings.download_chunk_size)
             if not chunk:
                 break
             yield chunk
+    finally:
+        await run_in_threadpool(body.close)
 
-    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-    return StreamingResponse(stream_body(), media_type=content_type, headers=headers)
+
+@router.get("/{token}")
+async def download_file(
+    token: str,
+    range_header: str | None = Header(default=None, alias="Range"),
+    if_none_match: str | None = Header(default=None),
+    s3_client: Any = Depends(get_s3_client),
+    presign_client: Any = Depends(get_presign_client),
+) -> Response:
+    file_key = _authorized_file_key(token)
+    if settings.download_mode == "redirect":
+        # MinIO serves the bytes (and Range/If-None-Match) directly to the client.
+        return _presigned_redirect(presign_client, file_key)
+
+    request_args: dict[str, Any] = {"Bucket": settings.minio_bucket_name, "Key": file_key}
+    if range_header:
+        request_args["Range"] = range_header
+    if if_none_match:
+        request_args["IfNoneMatch"] = if_none_match
+
+    try:
+        obj = await run_in_threadpool(s3_client.get_object, **request_args)
+    except ClientError as exc:
+        code = _error_code(exc)
+        if code in {"NoSuchKey", "404"}:
+            raise HTTPException(status_code=404, detail="File not found")
+        if code in {"NotModified", "304"}:
+            return Response(status_code=304, headers={"ETag": if_none_match or ""})
+        if code in {"InvalidRange", "416"}:
+            raise HTTPException(status_code=416, detail="Requested range not satisfiable")
+        raise
+
+    content_type = obj.get("ContentType") or "application/octet-stream"
+    status_code = 206 if obj.get("ContentRange") else 200
+    return StreamingResponse(
+        _iter_body(obj["Body"]),
+        status_code=status_code,
+        media_type=content_type,
+        headers=_object_headers(obj, file_key),
+    )
+
+
+@router.head("/{token}")
+async def download_file_head(token: str, s3_client: Any = Depends(get_s3_client)) -> Response:
+    file_key = _authorized_file_key(token)
+    try:
+        obj = await run_in_threadpool(
+            s3_client.head_object, Bucket=settings.minio_bucket_name, Key=file_key
+        )
+    except ClientError as exc:
+        if _error_code(exc) in {"NoSuchKey", "404", "NotFound"}:
+            raise HTTPException(status_code=404, detail="File not found")
+        raise
+
+    return Response(
+        status_code=200,
+        media_type=obj.get("ContentType") or "application/octet-stream",
+        headers=_object_headers(obj, file_key),
+    )
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any
+
+import aio_pika
+from fastapi import HTTPException, Request, status
+
+from config import settings
+from logging_config import logger
+from ttl_cache import TTLCache
+
+# Later stages win; an event for an earlier stage (e.g. the gateway's "queued" arriving after
+# the worker's "downloading") is ignored. "retrying" restarts the sequence for the next
+# attempt. Terminal states end the SSE stream.
+STAGE_ORDER = {
+    "queued": 0,
+    "retrying": 0,
+    "downloading": 1,
+    "converting": 2,
+    "uploading": 3,
+    "done": 4,
+    "failed": 4,
+}
+TERMINAL_STAGES = frozenset({"done", "failed"})
+
+
+@dataclass
+class JobState:
+    job_id: str
+    owner: str | None
+    status: str
+    updated_at: float
+    file_key: str | None = None
+    error: str | None = None
+    history: list[dict[str, Any]] = field(default_factory=list)
+
+    def to_public(self) -> dict[str, Any]:
+        data = asdict(self)
+        data.pop("owner")
+        return data
+
+
+class JobStatusStore:
+    """In-memory job index fed by status events, with per-job subscriber queues for SSE."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._jobs: TTLCache[JobState] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._subscribers: dict[str, set[asyncio.Queue[JobState]]] = {}
+
+    def get(self, job_id: str) -> JobState | None:
+        return self._jobs.get(job_id)
+
+    def apply(self, event: dict[str, Any]) -> None:
+        job_id = event.get("job_id")
+        stage = event.get("status")
+        if not job_id or stage not in STAGE_ORDER:
+            return
+        at = float(event.get("at") or time.time())
+        state = self._jobs.get(job_id)
+        if state is None:
+            state = JobState(job_id=job_id, owner=event.get("email"), status=stage, updated_at=at)
+        elif state.status in TERMINAL_STAGES or (
+            STAGE_ORDER[stage] < STAGE_ORDER[state.status]
+            and stage != "retrying"
+            and state.status != "retrying"
+        ):
+            return
+        elif state.history and state.history[-1] == {"status": stage, "at": at}:
+            # Already applied: the fanout echo of an event this replica recorded locally.
+            return
+        state.status = stage
+        state.updated_at = at
+        state.owner = state.owner or event.get("email")
+        state.file_key = event.get("file_key") or state.file_key
+        state.error = event.get("error") or state.error
+        state.history.append({"status": stage, "at": at})
+        self._jobs.set(job_id, state)
+
+        # The stored state keeps changing; each subscriber gets a snapshot of this stage.
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(replace(state, history=list(state.history)))
+
+    @contextmanager
+    def subscribe(self, job_id: str) -> Iterator[asyncio.Queue[JobState]]:
+        queue: asyncio.Queue[JobState] = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+
+def create_job_store() -> JobStatusStore:
+    return JobStatusStore(maxsize=settings.job_status_max_jobs, ttl=settings.job_status_ttl)
+
+
+async def start_status_consumer(
+    connection: aio_pika.abc.AbstractRobustConnection, store: JobStatusStore
+) -> aio_pika.abc.AbstractChannel:
+    """Bind a private queue to the status fanout so every gateway replica sees every event."""
+    channel = await connection.channel()
+    exchange = await channel.declare_exchange(
+        settings.job_status_exchange, aio_pika.ExchangeType.FANOUT, durable=True
+    )
+    queue = await channel.declare_queue(exclusive=True, auto_delete=True)
+    await queue.bind(exchange)
+
+    async def on_event(message: aio_pika.abc.AbstractIncomingMessage) -> None:
+        try:
+            store.apply(json.loads(message.body.decode()))
+        except Exception as exc:
+            logger.warning(f"Ignoring malformed job status event: {exc}")
+
+    await queue.consume(on_event, no_ack=True)
+    return channel
+
+
+def get_job_store(request: Request) -> JobStatusStore:
+    store: JobStatusStore | None = getattr(request.app.state, "job_store", None)
+    if store is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Job status unavailable"
+        )
+    return store
@@ -1,10 +1,48 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from auth_routes import router as auth_router
+from config import settings
 from convert_routes import router as convert_router
 from download_routes import router as download_router
+from job_status import create_job_store, start_status_consumer
+from metrics import MetricsMiddleware, start_metrics_server
+from proxy import create_http_client
+from publisher import create_publisher
+from s3_client import create_presign_client, create_s3_client
+from tracing import setup_tracing
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    metrics_server, _ = start_metrics_server(settings.metrics_port)
+    http_client = create_http_client()
+    app.state.http_client = http_client
+    app.state.s3_client = create_s3_client()
+    app.state.presign_client = create_presign_client()
+    publisher = create_publisher()
+    await publisher.start(
+        [settings.audio_in_queue, settings.audio_in_bulk_queue], [settings.job_status_exchange]
+    )
+    app.state.publisher = publisher
+    job_store = create_job_store()
+    await start_status_consumer(publisher.connection, job_store)
+    app.state.job_store = job_store
+    try:
+        yield
+    finally:
+        await publisher.close()
+        await http_client.aclose()
+        metrics_server.shutdown()
+        if tracer_provider is not None:
+            tracer_provider.shutdown()
+
 
-app = FastAPI(title="Gateway Service", version="0.1.0")
+app = FastAPI(title="Gateway Service", version="0.1.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+tracer_provider = setup_tracing(app)
 
 # Mount routes
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
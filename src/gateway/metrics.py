@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import time
+from threading import Thread
+from wsgiref.simple_server import WSGIServer
+
+from prometheus_client import Gauge, Histogram, start_http_server
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from logging_config import logger
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the end of the response, by route template.",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled.")
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware (not BaseHTTPMiddleware) so streamed responses are timed to their
+    last byte and nothing gets buffered."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; label by its template so
+            # path parameters don't explode the label set.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status_code)).observe(
+                time.perf_counter() - start
+            )
+
+
+def start_metrics_server(port: int) -> tuple[WSGIServer, Thread]:
+    """Serve ``/metrics`` on a side port; the Ingress routes every path of the main port."""
+    server = start_http_server(port)
+    logger.info(f"Metrics listening on :{port}")
+    return server
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+import httpx
+import jwt
+from fastapi import HTTPException, status
+
+from config import settings
+from ttl_cache import TTLCache
+
+_principals: TTLCache[dict[str, Any]] = TTLCache(
+    maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl
+)
+
+
+def _bearer_token(authorization: str | None) -> str:
+    if not authorization:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing Authorization header"
+        )
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing Bearer token")
+    return authorization.removeprefix("Bearer ").strip()
+
+
+def _verify_locally(token: str) -> dict[str, Any] | None:
+    """Check signature and expiry without a network hop; None if no key is configured."""
+    if not settings.jwt_secret:
+        return None
+    try:
+        return jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+
+async def _validate_remotely(client: httpx.AsyncClient, token: str) -> dict[str, Any]:
+    try:
+        response = await client.post(
+            f"{settings.auth_service_url}/validate",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=settings.validate_timeout,
+        )
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("valid"):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        return data
+    except httpx.HTTPStatusError as exc:
+        raise HTTPException(status_code=exc.response.status_code, detail=exc.response.json())
+    except httpx.RequestError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Auth unavailable"
+        )
+
+
+async def resolve_principal(client: httpx.AsyncClient, authorization: str | None) -> dict[str, Any]:
+    """Return the ``/validate``-shaped principal for a bearer token.
+
+    Tokens are verified locally on every request, so forged or expired tokens never reach
+    auth. A resolved principal is cached for ``PRINCIPAL_CACHE_TTL`` seconds (never past the
+    token's own expiry); after that auth is asked again, which is how deleted users and
+    revoked tokens stop working.
+    """
+    token = _bearer_token(authorization)
+    claims = _verify_locally(token)
+
+    principal = _principals.get(token)
+    if principal is not None:
+        return principal
+
+    principal = await _validate_remotely(client, token)
+    ttl = None
+    if claims is not None and "exp" in claims:
+        ttl = float(claims["exp"]) - time.time()
+    _principals.set(token, principal, ttl)
+    return principal
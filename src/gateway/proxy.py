@@ -1,36 +1,52 @@
 import httpx
-from fastapi import HTTPException, status
+from fastapi import HTTPException, Request, status
 
 from config import settings
 from logging_config import logger
 
+# Request headers passed on upstream; the rest (Host, cookies, hop-by-hop) stay here.
+_FORWARDED_HEADERS = frozenset({"authorization", "content-type"})
 
-async def forward_request(
-    method: str,
-    url: str,
-    headers: dict | None = None,
-    data: dict | None = None,
-    params: dict | None = None,
-) -> dict:
-    async with httpx.AsyncClient(timeout=settings.request_timeout) as client:
-        try:
-            response = await client.request(
-                method=method,
-                url=url,
-                headers=headers,
-                json=data,
-                params=params,
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=e.response.json(),
-            )
-        except httpx.RequestError as e:
-            logger.error(f"Request error: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Service unavailable",
-            )
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build the app-scoped client every route uses to reach upstream services."""
+    return httpx.AsyncClient(
+        timeout=settings.request_timeout,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+        http2=settings.http2_enabled,
+    )
+
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http_client
+
+
+async def forward_request(request: Request, url: str, timeout: float | None = None) -> dict:
+    """Replay ``request`` (method, body, query and auth headers) against ``url``."""
+    headers = {name: value for name, value in request.headers.items() if name in _FORWARDED_HEADERS}
+    try:
+        response = await get_http_client(request).request(
+            method=request.method,
+            url=url,
+            headers=headers,
+            content=await request.body(),
+            params=request.query_params,
+            timeout=timeout if timeout is not None else settings.request_timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=e.response.json(),
+        )
+    except httpx.RequestError as e:
+        logger.error(f"Request error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Service unavailable",
+        )
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import Any
+
+import aio_pika
+from aio_pika.pool import Pool
+from fastapi import HTTPException, Request, status
+from opentelemetry.trace import SpanKind
+
+from config import settings
+from logging_config import logger
+from tracing import inject_headers, tracer
+
+
+@dataclass
+class _Pending:
+    exchange: str
+    routing_key: str
+    message: aio_pika.Message
+    done: asyncio.Future[None] = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class QueuePublisher:
+    """App-scoped AMQP publisher with a channel pool and confirmed micro-batches.
+
+    Requests enqueue messages into a bounded in-memory queue; a few flusher tasks drain it
+    in batches of up to ``batch_size`` and publish each batch on a publisher-confirm channel,
+    resolving every caller once the broker has confirmed its message.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        pool_size: int,
+        batch_size: int,
+        batch_linger: float,
+        max_pending: int,
+    ) -> None:
+        self._url = url
+        self._pool_size = pool_size
+        self._batch_size = batch_size
+        self._batch_linger = batch_linger
+        self._pending: asyncio.Queue[_Pending] = asyncio.Queue(maxsize=max_pending)
+        self._connection: aio_pika.abc.AbstractRobustConnection | None = None
+        self._channels: Pool[aio_pika.abc.AbstractChannel] | None = None
+        self._declared: set[str] = set()
+        self._exchanges: set[str] = set()
+        self._flushers: list[asyncio.Task[None]] = []
+
+    async def _new_channel(self) -> aio_pika.abc.AbstractChannel:
+        assert self._connection is not None
+        return await self._connection.channel(publisher_confirms=True)
+
+    @property
+    def connection(self) -> aio_pika.abc.AbstractRobustConnection:
+        assert self._connection is not None
+        return self._connection
+
+    async def start(self, queues: list[str], fanout_exchanges: list[str] | None = None) -> None:
+        self._connection = await aio_pika.connect_robust(self._url)
+        self._channels = Pool(self._new_channel, max_size=self._pool_size)
+        async with self._channels.acquire() as channel:
+            for queue in queues:
+                await channel.declare_queue(queue, durable=True)
+                self._declared.add(queue)
+            for exchange in fanout_exchanges or []:
+                await channel.declare_exchange(exchange, aio_pika.ExchangeType.FANOUT, durable=True)
+                self._exchanges.add(exchange)
+        self._flushers = [
+            asyncio.create_task(self._flush_forever()) for _ in range(self._pool_size)
+        ]
+
+    async def close(self) -> None:
+        for task in self._flushers:
+            task.cancel()
+        for task in self._flushers:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        while not self._pending.empty():
+            item = self._pending.get_nowait()
+            if not item.done.done():
+                item.done.set_exception(RuntimeError("Publisher closed"))
+        if self._channels is not None:
+            await self._channels.close()
+        if self._connection is not None:
+            await self._connection.close()
+
+    async def _next_batch(self) -> list[_Pending]:
+        batch = [await self._pending.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._batch_linger
+        while len(batch) < self._batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._pending.get(), remaining))
+            except TimeoutError:
+                break
+        return batch
+
+    @staticmethod
+    async def _publish_one(channel: aio_pika.abc.AbstractChannel, item: _Pending) -> None:
+        if item.exchange:
+            # Declared at startup; ensure=False skips the round trip.
+            exchange = await channel.get_exchange(item.exchange, ensure=False)
+        else:
+            exchange = channel.default_exchange
+        await exchange.publish(item.message, routing_key=item.routing_key)
+
+    async def _flush_forever(self) -> None:
+        assert self._channels is not None
+        while True:
+            batch = await self._next_batch()
+            try:
+                async with self._channels.acquire() as channel:
+                    results = await asyncio.gather(
+                        *(self._publish_one(channel, item) for item in batch),
+                        return_exceptions=True,
+                    )
+            except Exception as exc:
+                results = [exc] * len(batch)
+            for item, result in zip(batch, results, strict=True):
+                if item.done.done():
+                    continue
+                if isinstance(result, BaseException):
+                    item.done.set_exception(result)
+                else:
+                    item.done.set_result(None)
+
+    async def publish_many(
+        self, routing_key: str, payloads: list[dict[str, Any]], *, exchange: str = ""
+    ) -> None:
+        """Publish JSON messages and wait until the broker confirms all of them.
+
+        Messages to the default exchange (i.e. straight to a queue) are persistent; messages to
+        a named fanout exchange are transient events.
+        """
+        if exchange:
+            if exchange not in self._exchanges:
+                raise ValueError(f"Exchange {exchange} was not declared at startup")
+        elif routing_key not in self._declared:
+            raise ValueError(f"Queue {routing_key} was not declared at startup")
+        delivery_mode = (
+            aio_pika.DeliveryMode.NOT_PERSISTENT if exchange else aio_pika.DeliveryMode.PERSISTENT
+        )
+        with tracer.start_as_current_span(
+            f"publish {exchange or routing_key}",
+            kind=SpanKind.PRODUCER,
+            attributes={
+                "messaging.system": "rabbitmq",
+                "messaging.destination.name": exchange or routing_key,
+                "messaging.batch.message_count": len(payloads),
+            },
+        ):
+            # Consumers continue the trace from the headers and derive queue wait time from
+            # the timestamp.
+            headers = inject_headers()
+            await self._enqueue(routing_key, payloads, exchange, delivery_mode, headers)
+
+    async def _enqueue(
+        self,
+        routing_key: str,
+        payloads: list[dict[str, Any]],
+        exchange: str,
+        delivery_mode: aio_pika.DeliveryMode,
+        headers: dict[str, Any],
+    ) -> None:
+        now = datetime.now(tz=UTC)
+        items = [
+            _Pending(
+                exchange=exchange,
+                routing_key=routing_key,
+                message=aio_pika.Message(
+                    body=json.dumps(payload).encode(),
+                    content_type="application/json",
+                    delivery_mode=delivery_mode,
+                    timestamp=now,
+                    headers=headers,
+                ),
+            )
+            for payload in payloads
+        ]
+        for item in items:
+            await self._pending.put(item)
+        await asyncio.gather(*(item.done for item in items))
+
+    async def publish(
+        self, routing_key: str, payload: dict[str, Any], *, exchange: str = ""
+    ) -> None:
+        await self.publish_many(routing_key, [payload], exchange=exchange)
+
+
+def create_publisher() -> QueuePublisher:
+    return QueuePublisher(
+        settings.rabbitmq_url,
+        pool_size=settings.publisher_pool_size,
+        batch_size=settings.publisher_batch_size,
+        batch_linger=settings.publisher_batch_linger_ms / 1000,
+        max_pending=settings.publisher_max_pending,
+    )
+
+
+def get_publisher(request: Request) -> QueuePublisher:
+    publisher: QueuePublisher | None = getattr(request.app.state, "publisher", None)
+    if publisher is None:
+        logger.error("Queue publisher is not initialised")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Queue unavailable"
+        )
+    return publisher
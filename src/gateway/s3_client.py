@@ -0,0 +1,31 @@
+from typing import Any
+
+import boto3
+from botocore.config import Config
+from fastapi import Request
+
+from config import settings
+
+
+def create_s3_client(endpoint_url: str | None = None) -> Any:
+    """Build the app-scoped MinIO client; boto3 clients are safe to share across threads."""
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url or settings.minio_url,
+        aws_access_key_id=settings.minio_access_key,
+        aws_secret_access_key=settings.minio_secret_key,
+        config=Config(max_pool_connections=settings.s3_max_pool_connections),
+    )
+
+
+def create_presign_client() -> Any:
+    # Signing happens locally, but the signature covers the host, so sign for the public one.
+    return create_s3_client(settings.minio_public_url)
+
+
+def get_s3_client(request: Request) -> Any:
+    return request.app.state.s3_client
+
+
+def get_presign_client(request: Request) -> Any:
+    return request.app.state.presign_client
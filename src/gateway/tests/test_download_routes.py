@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import datetime as dt
+import time
+from collections.abc import Iterator
+from urllib.parse import parse_qs, urlsplit
+
+import jwt
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from config import settings
+from download_routes import router
+from s3_client import create_s3_client
+
+PUBLIC_URL = "http://files.example.com:9000"
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch) -> Iterator[TestClient]:
+    monkeypatch.setattr(settings, "download_mode", "redirect")
+    monkeypatch.setattr(settings, "presigned_url_ttl", 120)
+    app = FastAPI()
+    app.include_router(router, prefix="/download")
+    # Redirect mode must not touch MinIO at all; an unreachable client proves it.
+    app.state.s3_client = create_s3_client("http://127.0.0.1:1")
+    app.state.presign_client = create_s3_client(PUBLIC_URL)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def _token(client: TestClient, email: str, file_key: str) -> str:
+    response = client.post("/download/generate-token", json={"email": email, "file_key": file_key})
+    return response.json()["token"]
+
+
+def test_redirect_points_at_a_presigned_url(client: TestClient) -> None:
+    token = _token(client, "a@b.c", "a@b.c/job-1.mp3")
+
+    response = client.get(f"/download/{token}", follow_redirects=False)
+
+    assert response.status_code == 307
+    assert response.headers["cache-control"] == "no-store"
+    location = urlsplit(response.headers["location"])
+    assert f"{location.scheme}://{location.netloc}" == PUBLIC_URL
+    assert location.path == f"/{settings.minio_bucket_name}/a%40b.c/job-1.mp3"
+    query = parse_qs(location.query)
+    assert query["AWSAccessKeyId"] == [settings.minio_access_key]
+    assert query["Signature"][0]
+    expires_in = int(query["Expires"][0]) - time.time()
+    assert 110 < expires_in <= 120
+    assert query["response-content-type"] == ["audio/mpeg"]
+    assert query["response-content-disposition"] == ['attachment; filename="job-1.mp3"']
+
+
+def test_redirect_serves_batch_archives_as_zip(client: TestClient) -> None:
+    token = _token(client, "a@b.c", "a@b.c/batches/b1.zip")
+
+    response = client.get(f"/download/{token}", follow_redirects=False)
+
+    query = parse_qs(urlsplit(response.headers["location"]).query)
+    assert query["response-content-type"] == ["application/zip"]
+    assert query["response-content-disposition"] == ['attachment; filename="b1.zip"']
+
+
+def test_redirect_refuses_another_users_file(client: TestClient) -> None:
+    token = _token(client, "a@b.c", "x@y.z/job-1.mp3")
+
+    response = client.get(f"/download/{token}", follow_redirects=False)
+
+    assert response.status_code == 403
+    assert "location" not in response.headers
+
+
+def test_redirect_refuses_an_expired_token(client: TestClient) -> None:
+    expired = dt.datetime.now(tz=dt.UTC) - dt.timedelta(minutes=1)
+    token = jwt.encode(
+        {"sub": "a@b.c", "file_key": "a@b.c/job-1.mp3", "exp": expired},
+        settings.download_token_secret,
+        algorithm="HS256",
+    )
+
+    response = client.get(f"/download/{token}", follow_redirects=False)
+
+    assert response.status_code == 401
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from config import settings
+from convert_routes import _announce_queued
+from job_status import JobStatusStore, start_status_consumer
+
+Callback = Callable[[Any], Awaitable[None]]
+
+
+class FakeBroker:
+    """Just enough of RabbitMQ for fanout: every queue bound to an exchange gets every event."""
+
+    def __init__(self) -> None:
+        self.bindings: dict[str, list[FakeQueue]] = defaultdict(list)
+
+    async def fanout(self, exchange: str, payloads: list[dict[str, Any]]) -> None:
+        for payload in payloads:
+            body = json.dumps(payload).encode()
+            for queue in self.bindings[exchange]:
+                await queue.deliver(body)
+
+
+class FakeMessage:
+    def __init__(self, body: bytes) -> None:
+        self.body = body
+
+
+class FakeExchange:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class FakeQueue:
+    def __init__(self, broker: FakeBroker) -> None:
+        self._broker = broker
+        self._callback: Callback | None = None
+
+    async def bind(self, exchange: FakeExchange) -> None:
+        self._broker.bindings[exchange.name].append(self)
+
+    async def consume(self, callback: Callback, no_ack: bool = False) -> str:
+        self._callback = callback
+        return "tag"
+
+    async def deliver(self, body: bytes) -> None:
+        assert self._callback is not None
+        await self._callback(FakeMessage(body))
+
+
+class FakeChannel:
+    def __init__(self, broker: FakeBroker) -> None:
+        self._broker = broker
+
+    async def declare_exchange(self, name: str, *_: Any, **__: Any) -> FakeExchange:
+        return FakeExchange(name)
+
+    async def declare_queue(self, *_: Any, **__: Any) -> FakeQueue:
+        return FakeQueue(self._broker)
+
+
+class FakeConnection:
+    def __init__(self, broker: FakeBroker) -> None:
+        self._broker = broker
+
+    async def channel(self) -> FakeChannel:
+        return FakeChannel(self._broker)
+
+
+class FakePublisher:
+    def __init__(self, broker: FakeBroker) -> None:
+        self._broker = broker
+
+    async def publish_many(
+        self, routing_key: str, payloads: list[dict[str, Any]], *, exchange: str = ""
+    ) -> None:
+        await self._broker.fanout(exchange, payloads)
+
+
+def _event(stage: str, at: float, **extra: Any) -> dict[str, Any]:
+    return {"job_id": "j1", "status": stage, "email": "u@example.com", "at": at, **extra}
+
+
+def _stages(store: JobStatusStore) -> list[str]:
+    state = store.get("j1")
+    assert state is not None
+    return [entry["status"] for entry in state.history]
+
+
+def test_stages_only_move_forward() -> None:
+    store = JobStatusStore(maxsize=10, ttl=60)
+    store.apply(_event("queued", 1))
+    store.apply(_event("converting", 3))
+    # Late or reordered events for earlier stages are dropped.
+    store.apply(_event("downloading", 2))
+    store.apply(_event("queued", 1.5))
+
+    assert _stages(store) == ["queued", "converting"]
+    assert store.get("j1").status == "converting"
+
+
+def test_retrying_restarts_the_sequence() -> None:
+    store = JobStatusStore(maxsize=10, ttl=60)
+    for at, stage in enumerate(["queued", "downloading", "converting", "retrying", "downloading"]):
+        store.apply(_event(stage, at, error="timeout" if stage == "retrying" else None))
+
+    state = store.get("j1")
+    assert state.status == "downloading"
+    assert state.error == "timeout"
+    assert _stages(store)[-2:] == ["retrying", "downloading"]
+
+
+def test_terminal_states_are_final() -> None:
+    store = JobStatusStore(maxsize=10, ttl=60)
+    store.apply(_event("done", 1, file_key="u/j1.mp3"))
+    store.apply(_event("retrying", 2))
+    store.apply(_event("failed", 3))
+
+    state = store.get("j1")
+    assert state.status == "done"
+    assert state.file_key == "u/j1.mp3"
+
+
+def test_malformed_events_are_ignored() -> None:
+    store = JobStatusStore(maxsize=10, ttl=60)
+    store.apply({"status": "queued"})
+    store.apply({"job_id": "j1", "status": "paused"})
+
+    assert store.get("j1") is None
+
+
+def test_subscribers_are_notified_until_they_leave() -> None:
+    store = JobStatusStore(maxsize=10, ttl=60)
+    with store.subscribe("j1") as queue:
+        store.apply(_event("queued", 1))
+        store.apply(_event("downloading", 2))
+        assert queue.qsize() == 2
+    store.apply(_event("converting", 3))
+
+    assert queue.qsize() == 2
+    assert [queue.get_nowait().status for _ in range(2)] == ["queued", "downloading"]
+
+
+async def test_fanout_reaches_every_replica_once() -> None:
+    broker = FakeBroker()
+    local, remote = JobStatusStore(maxsize=10, ttl=60), JobStatusStore(maxsize=10, ttl=60)
+    for store in (local, remote):
+        await start_status_consumer(FakeConnection(broker), store)  # type: ignore[arg-type]
+
+    publisher = FakePublisher(broker)
+    await _announce_queued(publisher, local, ["j1"], "u@example.com")  # type: ignore[arg-type]
+    await broker.fanout(settings.job_status_exchange, [_event("downloading", 10**10)])
+
+    # The replica that accepted the job applied "queued" itself and then got the echo.
+    assert _stages(local) == ["queued", "downloading"]
+    assert _stages(remote) == ["queued", "downloading"]
+    assert local.get("j1").owner == "u@example.com"
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+
+
+class TTLCache[V]:
+    """Bounded LRU mapping whose entries also expire after a per-entry deadline."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: str) -> V | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: V, ttl: float | None = None) -> None:
+        ttl = self._ttl if ttl is None else min(ttl, self._ttl)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
@@ -1,4 +1,5 @@
 import sys
+from typing import Literal
 
 from pydantic import Field, ValidationError
 from pydantic_settings import BaseSettings
@@ -14,7 +15,35 @@ class Settings(BaseSettings):
     audio_queue: str = Field(validation_alias="AUDIO_OUT_QUEUE", default="audio_out")
     sender_email: str = Field(validation_alias="SENDER_EMAIL", default="onboarding@resend.dev")
     resend_base_url: str = Field(default="https://api.resend.com")
+    resend_timeout: float = Field(validation_alias="RESEND_TIMEOUT", default=10, gt=0)
+    resend_max_connections: int = Field(validation_alias="RESEND_MAX_CONNECTIONS", default=20, ge=1)
     gateway_external_url: str = Field(validation_alias="GATEWAY_EXTERNAL_URL")
+    # Shared with the gateway so download tokens can be minted without calling it.
+    download_token_secret: str = Field(validation_alias="DOWNLOAD_TOKEN_SECRET")
+    download_token_ttl_minutes: int = Field(
+        validation_alias="DOWNLOAD_TOKEN_TTL_MINUTES", default=60, ge=1
+    )
+
+    # Consumption
+    prefetch_count: int = Field(validation_alias="PREFETCH_COUNT", default=64, ge=1)
+    max_concurrent_sends: int = Field(validation_alias="MAX_CONCURRENT_SENDS", default=16, ge=1)
+    # Batch mode groups notifications into Resend's /emails/batch; PREFETCH_COUNT must be at
+    # least BATCH_SIZE for batches to fill up.
+    batch_enabled: bool = Field(validation_alias="EMAIL_BATCH_ENABLED", default=False)
+    batch_size: int = Field(validation_alias="EMAIL_BATCH_SIZE", default=50, ge=1, le=100)
+    batch_linger_ms: float = Field(validation_alias="EMAIL_BATCH_LINGER_MS", default=500, ge=0)
+
+    metrics_port: int = Field(validation_alias="METRICS_PORT", default=9100)
+
+    # Tracing: "otlp" exports to OTEL_EXPORTER_OTLP_ENDPOINT, "file" appends one JSON span per
+    # line to TRACING_FILE.
+    tracing_exporter: Literal["none", "otlp", "file"] = Field(
+        validation_alias="TRACING_EXPORTER", default="none"
+    )
+    tracing_file: str = Field(validation_alias="TRACING_FILE", default="traces.jsonl")
+    tracing_sample_ratio: float = Field(
+        validation_alias="TRACING_SAMPLE_RATIO", default=1.0, ge=0, le=1
+    )
 
 
 try:
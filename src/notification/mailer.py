@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+from http import HTTPStatus
+from typing import Any
+
+import aio_pika
+import httpx
+from opentelemetry import trace
+
+from config import settings
+from logging_config import logger
+from metrics import EMAILS, RESEND_SECONDS
+from tracing import extract_context, tracer
+
+# Resend accepts at most this many emails per /emails/batch call.
+RESEND_MAX_BATCH = 100
+
+
+def create_resend_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=settings.resend_base_url,
+        timeout=settings.resend_timeout,
+        headers={
+            "Authorization": f"Bearer {settings.resend_api_key}",
+            "Content-Type": "application/json",
+        },
+        limits=httpx.Limits(
+            max_connections=settings.resend_max_connections,
+            max_keepalive_connections=settings.resend_max_connections,
+        ),
+    )
+
+
+def build_email(name: str | None, email: str, download_url: str) -> dict[str, Any]:
+    html = (
+        f"<p>Hello {name or 'there'},</p>"
+        f'<p>Your MP3 file is ready: <a href="{download_url}">Download</a></p>'
+        f"<p>Regards,<br/>MP3 Converter</p>"
+    )
+    return {
+        "from": f"MP3 Converter <{settings.sender_email}>",
+        "to": [email],
+        "subject": "Your MP3 is ready",
+        "html": html,
+    }
+
+
+async def _post(client: httpx.AsyncClient, path: str, data: Any) -> None:
+    count = len(data) if isinstance(data, list) else 1
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        resp = await client.post(path, json=data)
+        failed = resp.status_code >= HTTPStatus.BAD_REQUEST
+        outcome = str(resp.status_code) if failed else "ok"
+        if failed:
+            try:
+                error_body = resp.json()
+            except ValueError:
+                error_body = resp.text
+            logger.error(f"Resend API error {resp.status_code}: {error_body}")
+        resp.raise_for_status()
+    except httpx.HTTPStatusError as exc:
+        request_id = exc.response.headers.get("x-request-id") or exc.response.headers.get(
+            "X-Request-ID"
+        )
+        try:
+            body = exc.response.json()
+        except ValueError:
+            body = exc.response.text
+        logger.error(
+            f"Failed to send via Resend ({exc.response.status_code}) "
+            f"request_id={request_id} body={body}"
+        )
+        raise
+    finally:
+        RESEND_SECONDS.labels(path, outcome).observe(time.perf_counter() - start)
+        EMAILS.labels("sent" if outcome == "ok" else "failed").inc(count)
+
+
+async def send_email(client: httpx.AsyncClient, email: dict[str, Any]) -> None:
+    await _post(client, "/emails", email)
+
+
+async def send_batch(client: httpx.AsyncClient, emails: list[dict[str, Any]]) -> None:
+    await _post(client, "/emails/batch", emails)
+
+
+class EmailBatcher:
+    """Collects pending notifications and sends them through Resend's batch endpoint.
+
+    A batch is flushed when it reaches ``batch_size`` or ``linger`` seconds after its first
+    email arrived. Source messages are acked only once their batch has been handed off.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, batch_size: int, linger: float) -> None:
+        self._client = client
+        self._batch_size = min(batch_size, RESEND_MAX_BATCH)
+        self._linger = linger
+        self._items: list[tuple[aio_pika.abc.AbstractIncomingMessage, dict[str, Any]]] = []
+        self._timer: asyncio.Task[None] | None = None
+        self._sending: set[asyncio.Task[None]] = set()
+
+    async def submit(
+        self, message: aio_pika.abc.AbstractIncomingMessage, email: dict[str, Any]
+    ) -> None:
+        self._items.append((message, email))
+        if len(self._items) >= self._batch_size:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._linger)
+        self._timer = None
+        self._flush_now()
+
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items = self._items, []
+        if not items:
+            return
+        task = asyncio.create_task(self._send(items))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(
+        self, items: list[tuple[aio_pika.abc.AbstractIncomingMessage, dict[str, Any]]]
+    ) -> None:
+        # One send serves many traces; link it to each of them rather than picking a parent.
+        links = [
+            trace.Link(trace.get_current_span(extract_context(m.headers)).get_span_context())
+            for m, _ in items
+        ]
+        try:
+            with tracer.start_as_current_span(
+                "send email batch",
+                links=links,
+                attributes={"app.batch_size": len(items)},
+            ):
+                await send_batch(self._client, [email for _, email in items])
+        except Exception as exc:
+            logger.error(f"Failed to send batch of {len(items)} emails: {exc}")
+            for message, _ in items:
+                with contextlib.suppress(Exception):
+                    await message.reject(requeue=False)
+            return
+        for message, _ in items:
+            with contextlib.suppress(Exception):
+                await message.ack()
+
+    async def close(self) -> None:
+        self._flush_now()
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
@@ -1,94 +1,101 @@
 from __future__ import annotations
 
 import asyncio
+import datetime as dt
 import json
+from functools import partial
 
 import aio_pika
 import httpx
+import jwt
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind
 
 from config import settings
 from logging_config import logger
+from mailer import EmailBatcher, build_email, create_resend_client, send_email
+from metrics import start_metrics_server
+from tracing import extract_context, setup_tracing, tracer
 
-GATEWAY_INTERNAL_URL = "http://gateway-service:80"
-
-
-async def send_email(name: str | None, email: str, file_key: str) -> None:
-    async with httpx.AsyncClient(timeout=10) as http_client:
-        try:
-            token_resp = await http_client.post(
-                f"{GATEWAY_INTERNAL_URL}/download/generate-token",
-                json={"email": email, "file_key": file_key},
-                timeout=10,
-            )
-            token_resp.raise_for_status()
-            download_token = token_resp.json().get("token")
-            if not download_token:
-                raise RuntimeError("Invalid token response from gateway")
-        except (httpx.HTTPStatusError, httpx.RequestError) as exc:
-            logger.error(f"Failed to obtain download token: {exc}")
-            raise
 
-    download_url = f"{settings.gateway_external_url}/download/{download_token}"
-
-    subject = "Your MP3 is ready"
-    html = (
-        f"<p>Hello {name or 'there'},</p>"
-        f'<p>Your MP3 file is ready: <a href="{download_url}">Download</a></p>'
-        f"<p>Regards,<br/>MP3 Converter</p>"
+def mint_download_token(email: str, file_key: str) -> str:
+    # Same claims and signing key as the gateway's /download/generate-token, minted here to
+    # save an HTTP hop per notification.
+    expiration = dt.datetime.now(tz=dt.UTC) + dt.timedelta(
+        minutes=settings.download_token_ttl_minutes
     )
-    async with httpx.AsyncClient(base_url=settings.resend_base_url, timeout=10) as client:
-        headers = {
-            "Authorization": f"Bearer {settings.resend_api_key}",
-            "Content-Type": "application/json",
-        }
-        data = {
-            "from": f"MP3 Converter <{settings.sender_email}>",
-            "to": [email],
-            "subject": subject,
-            "html": html,
-        }
-        try:
-            resp = await client.post("/emails", headers=headers, json=data)
-            if resp.status_code >= 400:
-                try:
-                    error_body = resp.json()
-                except ValueError:
-                    error_body = resp.text
-                logger.error(f"Resend API error {resp.status_code}: {error_body}")
-            resp.raise_for_status()
-        except httpx.HTTPStatusError as exc:
-            request_id = exc.response.headers.get("x-request-id") or exc.response.headers.get(
-                "X-Request-ID"
-            )
+    to_encode = {"sub": email, "file_key": file_key, "exp": expiration}
+    return jwt.encode(to_encode, settings.download_token_secret, algorithm="HS256")
+
+
+def _email_for(payload: dict[str, str]) -> dict:
+    download_token = mint_download_token(payload["email"], payload["file_key"])
+    download_url = f"{settings.gateway_external_url}/download/{download_token}"
+    return build_email(payload.get("name"), payload["email"], download_url)
+
+
+async def process_message(
+    message: aio_pika.abc.AbstractIncomingMessage,
+    client: httpx.AsyncClient,
+    slots: asyncio.Semaphore,
+) -> None:
+    async with slots, message.process(requeue=False):
+        with tracer.start_as_current_span(
+            f"process {settings.audio_queue}",
+            context=extract_context(message.headers),
+            kind=SpanKind.CONSUMER,
+            attributes={
+                "messaging.system": "rabbitmq",
+                "messaging.destination.name": settings.audio_queue,
+            },
+        ) as span:
             try:
-                body = exc.response.json()
-            except ValueError:
-                body = exc.response.text
-            logger.error(
-                f"Failed to send via Resend ({exc.response.status_code}) "
-                f"request_id={request_id} body={body}"
-            )
-            raise
+                payload = json.loads(message.body.decode())
+                await send_email(client, _email_for(payload))
+            except Exception as exc:
+                logger.error(f"Failed to send email: {exc}")
+                span.record_exception(exc)
+                span.set_status(trace.Status(trace.StatusCode.ERROR, str(exc)))
 
 
-async def process_message(message: aio_pika.abc.AbstractIncomingMessage) -> None:
-    async with message.process(requeue=False):
-        try:
-            payload = json.loads(message.body.decode())
-            await send_email(payload.get("name"), payload["email"], payload["file_key"])
-        except Exception as exc:
-            logger.error(f"Failed to send email: {exc}")
+async def process_message_batched(
+    message: aio_pika.abc.AbstractIncomingMessage, batcher: EmailBatcher
+) -> None:
+    try:
+        payload = json.loads(message.body.decode())
+        email = _email_for(payload)
+    except Exception as exc:
+        logger.error(f"Failed to send email: {exc}")
+        await message.reject(requeue=False)
+        return
+    await batcher.submit(message, email)
 
 
 async def run() -> None:
+    start_metrics_server(settings.metrics_port)
+    tracer_provider = setup_tracing()
+    client = create_resend_client()
+    batcher: EmailBatcher | None = None
     connection = await aio_pika.connect_robust(settings.rabbitmq_url)
-    channel = await connection.channel()
-    queue = await channel.declare_queue(settings.audio_queue, durable=True)
-    await queue.consume(process_message, no_ack=False)
     try:
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=settings.prefetch_count)
+        queue = await channel.declare_queue(settings.audio_queue, durable=True)
+        if settings.batch_enabled:
+            batcher = EmailBatcher(client, settings.batch_size, settings.batch_linger_ms / 1000)
+            callback = partial(process_message_batched, batcher=batcher)
+        else:
+            slots = asyncio.Semaphore(settings.max_concurrent_sends)
+            callback = partial(process_message, client=client, slots=slots)
+        await queue.consume(callback, no_ack=False)
         await asyncio.Future()
     finally:
+        if batcher is not None:
+            await batcher.close()
         await connection.close()
+        await client.aclose()
+        if tracer_provider is not None:
+            tracer_provider.shutdown()
 
 
 def main() -> None:
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from prometheus_client import Counter, Histogram, start_http_server
+
+from logging_config import logger
+
+RESEND_SECONDS = Histogram(
+    "notification_resend_request_seconds",
+    "Latency of Resend API calls by endpoint and outcome.",
+    ["endpoint", "outcome"],
+)
+EMAILS = Counter("notification_emails_total", "Notification emails by outcome.", ["outcome"])
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve ``/metrics`` on a side port; the consumer itself has no HTTP interface."""
+    start_http_server(port)
+    logger.info(f"Metrics listening on :{port}")
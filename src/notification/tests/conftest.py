@@ -0,0 +1,8 @@
+from __future__ import annotations
+
+import os
+
+# Settings are read at import time; give the required ones a value before any test imports.
+os.environ.setdefault("RESEND_API_KEY", "test")
+os.environ.setdefault("GATEWAY_EXTERNAL_URL", "http://gateway.test")
+os.environ.setdefault("DOWNLOAD_TOKEN_SECRET", "test")
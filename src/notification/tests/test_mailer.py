@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any
+
+import httpx
+import pytest
+
+from mailer import RESEND_MAX_BATCH, EmailBatcher, build_email
+
+
+class FakeMessage:
+    """Records how the batcher settled a delivery."""
+
+    def __init__(self) -> None:
+        self.headers: dict[str, Any] = {}
+        self.outcome: str | None = None
+
+    async def ack(self) -> None:
+        self.outcome = "acked"
+
+    async def reject(self, requeue: bool = False) -> None:
+        self.outcome = "requeued" if requeue else "rejected"
+
+
+class FakeResend:
+    """Stands in for Resend's /emails/batch endpoint."""
+
+    def __init__(self, status_code: int = 200) -> None:
+        self.status_code = status_code
+        self.batches: list[list[dict[str, Any]]] = []
+        self.received = asyncio.Event()
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/emails/batch"
+        self.batches.append(json.loads(request.content))
+        self.received.set()
+        return httpx.Response(self.status_code, json={"data": []})
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url="https://resend.test", transport=httpx.MockTransport(self)
+        )
+
+
+def _email(n: int) -> dict[str, Any]:
+    return build_email(f"user {n}", f"user{n}@example.com", f"https://dl.test/{n}")
+
+
+async def _submit(batcher: EmailBatcher, count: int) -> list[FakeMessage]:
+    messages = [FakeMessage() for _ in range(count)]
+    for n, message in enumerate(messages):
+        await batcher.submit(message, _email(n))  # type: ignore[arg-type]
+    return messages
+
+
+async def test_full_batch_is_sent_without_waiting_for_the_timer() -> None:
+    resend = FakeResend()
+    batcher = EmailBatcher(resend.client(), batch_size=3, linger=60)
+
+    messages = await _submit(batcher, 3)
+    await asyncio.wait_for(resend.received.wait(), timeout=1)
+    await batcher.close()
+
+    assert [len(batch) for batch in resend.batches] == [3]
+    assert [m.outcome for m in messages] == ["acked"] * 3
+
+
+async def test_partial_batch_is_sent_when_the_timer_fires() -> None:
+    resend = FakeResend()
+    batcher = EmailBatcher(resend.client(), batch_size=10, linger=0.05)
+
+    messages = await _submit(batcher, 2)
+    await asyncio.sleep(0.01)
+    assert resend.batches == []
+
+    await asyncio.wait_for(resend.received.wait(), timeout=1)
+    await batcher.close()
+
+    assert [len(batch) for batch in resend.batches] == [2]
+    assert resend.batches[0][1]["to"] == ["user1@example.com"]
+    assert [m.outcome for m in messages] == ["acked", "acked"]
+
+
+async def test_overflow_starts_the_next_batch() -> None:
+    resend = FakeResend()
+    batcher = EmailBatcher(resend.client(), batch_size=2, linger=60)
+
+    await _submit(batcher, 5)
+    await batcher.close()
+
+    assert sorted(len(batch) for batch in resend.batches) == [1, 2, 2]
+
+
+async def test_close_flushes_what_is_pending() -> None:
+    resend = FakeResend()
+    batcher = EmailBatcher(resend.client(), batch_size=10, linger=60)
+
+    messages = await _submit(batcher, 1)
+    await batcher.close()
+
+    assert len(resend.batches) == 1
+    assert messages[0].outcome == "acked"
+
+
+async def test_failed_batch_rejects_its_messages() -> None:
+    resend = FakeResend(status_code=500)
+    batcher = EmailBatcher(resend.client(), batch_size=2, linger=60)
+
+    messages = await _submit(batcher, 2)
+    await batcher.close()
+
+    assert [m.outcome for m in messages] == ["rejected", "rejected"]
+
+
+@pytest.mark.parametrize("batch_size", [RESEND_MAX_BATCH, RESEND_MAX_BATCH + 50])
+async def test_batches_never_exceed_resend_limit(batch_size: int) -> None:
+    resend = FakeResend()
+    batcher = EmailBatcher(resend.client(), batch_size=batch_size, linger=60)
+
+    await _submit(batcher, RESEND_MAX_BATCH + 1)
+    await batcher.close()
+
+    assert sorted(len(batch) for batch in resend.batches) == [1, RESEND_MAX_BATCH]
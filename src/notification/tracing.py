@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from typing import Any
+
+from opentelemetry import context, propagate, trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+from config import settings
+from logging_config import logger
+
+tracer = trace.get_tracer("notification")
+
+
+def _exporter() -> SpanExporter | None:
+    if settings.tracing_exporter == "otlp":
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables.
+        return OTLPSpanExporter()
+    if settings.tracing_exporter == "file":
+        out = open(settings.tracing_file, "a")  # noqa: SIM115, PTH123
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    return None
+
+
+def setup_tracing() -> TracerProvider | None:
+    """Install the global tracer provider; spans are dropped when TRACING_EXPORTER is none."""
+    exporter = _exporter()
+    if exporter is None:
+        return None
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "notification"}),
+        sampler=ParentBased(TraceIdRatioBased(settings.tracing_sample_ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+    HTTPXClientInstrumentor().instrument()
+    logger.info(f"Tracing enabled ({settings.tracing_exporter})")
+    return provider
+
+
+def extract_context(headers: dict[str, Any] | None) -> context.Context:
+    carrier = {
+        key: value.decode() if isinstance(value, bytes) else value
+        for key, value in (headers or {}).items()
+        if isinstance(value, str | bytes)
+    }
+    return propagate.extract(carrier)
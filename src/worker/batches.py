@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import Any
+
+from botocore.exceptions import ClientError
+
+from config import settings
+from logging_config import logger
+from scratch import ScratchSpace
+
+
+@dataclass(frozen=True)
+class BatchInfo:
+    batch_id: str
+    size: int
+
+    @classmethod
+    def from_payload(cls, payload: dict[str, Any]) -> BatchInfo | None:
+        """Batch membership of a job, if it belongs to a batch that wants a single archive."""
+        if not payload.get("zip_on_completion") or not payload.get("batch_id"):
+            return None
+        return cls(batch_id=str(payload["batch_id"]), size=int(payload["batch_size"]))
+
+
+class BatchArchiver:
+    """Collects finished batch items in the bucket and zips them once the last one lands.
+
+    Each item writes a marker object; whichever worker observes the full count claims the
+    batch with a conditional create, so exactly one of them builds and announces the archive.
+    The claim names the job that took it, so if that job fails or crashes before the archive
+    is out, its redelivery picks the batch up again instead of finding it already claimed.
+    """
+
+    def __init__(self, s3: Any, bucket: str, prefix: str, scratch: ScratchSpace) -> None:
+        self._s3 = s3
+        self._bucket = bucket
+        self._prefix = prefix.strip("/")
+        self._scratch = scratch
+
+    def _batch_prefix(self, batch_id: str) -> str:
+        return f"{self._prefix}/{batch_id}"
+
+    async def record(
+        self, batch: BatchInfo, job_id: str, file_key: str | None, error: str | None = None
+    ) -> list[str] | None:
+        """Record one item; returns the batch's file keys if this call completed the batch."""
+        base = self._batch_prefix(batch.batch_id)
+        marker = {"file_key": file_key, "error": error}
+        await asyncio.to_thread(
+            self._s3.put_object,
+            Bucket=self._bucket,
+            Key=f"{base}/items/{job_id}.json",
+            Body=json.dumps(marker).encode(),
+            ContentType="application/json",
+        )
+        # Only keys are listed per item; marker bodies are read once, by the claimant.
+        keys = await asyncio.to_thread(self._list_keys, f"{base}/items/")
+        if len(keys) < batch.size or not await self._claim(f"{base}/claim", job_id):
+            return None
+        markers = await asyncio.to_thread(self._read_markers, keys)
+        return [m["file_key"] for m in markers if m.get("file_key")]
+
+    def _list_keys(self, prefix: str) -> list[str]:
+        paginator = self._s3.get_paginator("list_objects_v2")
+        return [
+            obj["Key"]
+            for page in paginator.paginate(Bucket=self._bucket, Prefix=prefix)
+            for obj in page.get("Contents", [])
+        ]
+
+    def _read_markers(self, keys: list[str]) -> list[dict[str, Any]]:
+        return [
+            json.loads(self._s3.get_object(Bucket=self._bucket, Key=key)["Body"].read())
+            for key in sorted(keys)
+        ]
+
+    async def _claim(self, key: str, job_id: str) -> bool:
+        try:
+            await asyncio.to_thread(
+                self._s3.put_object,
+                Bucket=self._bucket,
+                Key=key,
+                Body=job_id.encode(),
+                IfNoneMatch="*",
+            )
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") not in {"PreconditionFailed", "412"}:
+                raise
+            return await asyncio.to_thread(self._claimed_by, key) == job_id
+        return True
+
+    def _claimed_by(self, key: str) -> str:
+        return self._s3.get_object(Bucket=self._bucket, Key=key)["Body"].read().decode()
+
+    def _archive_size(self, file_keys: list[str]) -> int:
+        # Entries are stored, so the archive is their total plus a little per-entry metadata.
+        sizes = (
+            self._s3.head_object(Bucket=self._bucket, Key=key)["ContentLength"] for key in file_keys
+        )
+        return sum(sizes) + 1024 * len(file_keys)
+
+    def _build_zip(self, file_keys: list[str], archive_key: str, path: Path) -> None:
+        # MP3 is already compressed; storing avoids burning CPU for ~0% gain.
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as archive:
+            seen: set[str] = set()
+            for key in file_keys:
+                name = PurePosixPath(key).name
+                if name in seen:
+                    name = f"{len(seen)}-{name}"
+                seen.add(name)
+                body = self._s3.get_object(Bucket=self._bucket, Key=key)["Body"]
+                with archive.open(name, "w", force_zip64=True) as entry:
+                    while chunk := body.read(1 << 20):
+                        entry.write(chunk)
+        self._s3.upload_file(
+            str(path),
+            self._bucket,
+            archive_key,
+            ExtraArgs={"ContentType": "application/zip"},
+        )
+
+    async def build_archive(
+        self, batch: BatchInfo, user_email: str | None, file_keys: list[str]
+    ) -> str:
+        archive_key = f"{user_email}/batches/{batch.batch_id}.zip"
+        logger.info(f"Zipping {len(file_keys)} files for batch {batch.batch_id}")
+        expected = await asyncio.to_thread(self._archive_size, file_keys)
+        async with self._scratch.job(expected) as scratch:
+            path = scratch.file("batch.zip")
+            await asyncio.to_thread(self._build_zip, file_keys, archive_key, path)
+        return archive_key
+
+
+def create_archiver(s3: Any, scratch: ScratchSpace) -> BatchArchiver:
+    return BatchArchiver(s3, settings.minio_bucket_name, settings.batch_prefix, scratch)
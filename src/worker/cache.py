@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from collections.abc import Mapping, Sequence
+from typing import Any
+
+from botocore.exceptions import ClientError
+
+from logging_config import logger
+from metrics import CACHE_LOOKUPS
+
+
+def _fingerprint(encode_args: Sequence[str]) -> str:
+    return hashlib.sha256("\0".join(encode_args).encode()).hexdigest()[:16]
+
+
+def content_key(content_digest: str, encode_args: Sequence[str]) -> str:
+    """Cache key for a given input byte stream encoded with the given ffmpeg arguments."""
+    return f"{content_digest}-{_fingerprint(encode_args)}"
+
+
+def url_key(url: str, headers: Mapping[str, str], encode_args: Sequence[str]) -> str | None:
+    """Cache key for a URL pinned by its HTTP validators, or None if the origin sends none."""
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return None
+    # Weak ETags still identify the representation well enough to reuse an encode.
+    raw = "\0".join([url, etag or "", last_modified or "", _fingerprint(encode_args)])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ConversionCache:
+    """Shared MP3 objects keyed by input content, with URL+validator pointers to them.
+
+    Cached encodes live under ``{prefix}/objects/`` and are copied server-side into the
+    user's namespace on a hit, so the download path's per-user key check still applies.
+    """
+
+    def __init__(self, s3: Any, bucket: str, prefix: str) -> None:
+        self._s3 = s3
+        self._bucket = bucket
+        self._prefix = prefix.strip("/")
+
+    def _object_key(self, key: str) -> str:
+        return f"{self._prefix}/objects/{key}.mp3"
+
+    def _pointer_key(self, key: str) -> str:
+        return f"{self._prefix}/urls/{key}.json"
+
+    async def _exists(self, object_key: str) -> bool:
+        try:
+            await asyncio.to_thread(self._s3.head_object, Bucket=self._bucket, Key=object_key)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in {"404", "NoSuchKey", "NotFound"}:
+                return False
+            raise
+        return True
+
+    async def lookup_content(self, key: str) -> str | None:
+        object_key = self._object_key(key)
+        found = await self._exists(object_key)
+        CACHE_LOOKUPS.labels(kind="content", result="hit" if found else "miss").inc()
+        return object_key if found else None
+
+    async def lookup_url(self, key: str) -> str | None:
+        try:
+            obj = await asyncio.to_thread(
+                self._s3.get_object, Bucket=self._bucket, Key=self._pointer_key(key)
+            )
+            target = json.loads(obj["Body"].read())["object_key"]
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") not in {"404", "NoSuchKey"}:
+                raise
+            target = None
+        # The pointer may outlive its object (e.g. after a lifecycle expiry).
+        found = target is not None and await self._exists(target)
+        CACHE_LOOKUPS.labels(kind="url", result="hit" if found else "miss").inc()
+        return target if found else None
+
+    async def copy_to(self, cached_key: str, dest_key: str) -> None:
+        await asyncio.to_thread(
+            self._s3.copy_object,
+            Bucket=self._bucket,
+            Key=dest_key,
+            CopySource={"Bucket": self._bucket, "Key": cached_key},
+            ContentType="audio/mpeg",
+            MetadataDirective="REPLACE",
+        )
+
+    async def link_url(self, url: str, cached_key: str) -> None:
+        await asyncio.to_thread(
+            self._s3.put_object,
+            Bucket=self._bucket,
+            Key=self._pointer_key(url),
+            Body=json.dumps({"object_key": cached_key}).encode(),
+            ContentType="application/json",
+        )
+
+    async def store(self, source_key: str, content: str, url: str | None) -> None:
+        """Record a fresh encode under its content key and, if known, its URL key.
+
+        Failures are logged and swallowed: the job already succeeded without the cache.
+        """
+        try:
+            target = self._object_key(content)
+            await self.copy_to(source_key, target)
+            if url is not None:
+                await self.link_url(url, target)
+        except Exception:
+            logger.warning(f"Failed to populate conversion cache from {source_key}", exc_info=True)
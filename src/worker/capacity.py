@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import time
+from collections import deque
+
+import aio_pika
+
+from config import settings
+from logging_config import logger
+from scheduling import WeightedSlots
+
+WORKER_ID = os.environ.get("HOSTNAME") or socket.gethostname()
+
+# Wall time of this worker's most recent jobs, used for the scaler's drain-time estimate.
+_recent_jobs: deque[float] = deque(maxlen=50)
+
+
+def record_job(seconds: float) -> None:
+    _recent_jobs.append(seconds)
+
+
+def heartbeat(slots: WeightedSlots) -> dict[str, object]:
+    return {
+        "worker": WORKER_ID,
+        "capacity": slots.capacity,
+        "free": slots.free,
+        "job_seconds": statistics.median(_recent_jobs) if _recent_jobs else None,
+        "samples": len(_recent_jobs),
+        "at": time.time(),
+    }
+
+
+async def publish_heartbeats(channel: aio_pika.abc.AbstractChannel, slots: WeightedSlots) -> None:
+    """Announce this worker's slots to the capacity fanout exchange until cancelled.
+
+    Heartbeats expire after a few intervals, so a scaler that was down does not replay
+    stale ones; missing a heartbeat only makes the scaler's picture slightly older.
+    """
+    exchange = await channel.declare_exchange(
+        settings.capacity_exchange, aio_pika.ExchangeType.FANOUT
+    )
+    interval = settings.capacity_interval_seconds
+    while True:
+        try:
+            await exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps(heartbeat(slots)).encode(),
+                    content_type="application/json",
+                    delivery_mode=aio_pika.DeliveryMode.NOT_PERSISTENT,
+                    expiration=interval * 3,
+                ),
+                routing_key="",
+            )
+        except Exception as exc:
+            logger.warning(f"Failed to publish capacity heartbeat: {exc}")
+        await asyncio.sleep(interval)
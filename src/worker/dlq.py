@@ -0,0 +1,104 @@
+"""Inspect and replay the worker's dead-letter queue.
+
+    python dlq.py list [--limit N]
+    python dlq.py replay [--limit N] [--job-id ID ...]
+
+Messages are held unacknowledged while scanning, so nothing is seen twice; whatever is not
+replayed is returned to the queue untouched.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from datetime import UTC, datetime
+
+import aio_pika
+
+from config import settings
+from retry import ORIGIN_QUEUE_HEADER, RETRY_COUNT_HEADER
+
+
+def _describe(message: aio_pika.abc.AbstractIncomingMessage) -> str:
+    headers = message.headers or {}
+    try:
+        payload = json.loads(message.body.decode())
+    except ValueError:
+        payload = {}
+    failed_at = headers.get("x-failed-at")
+    when = datetime.fromtimestamp(float(failed_at), UTC).isoformat() if failed_at else "?"
+    return (
+        f"{payload.get('job_id', '?')}  {when}  {headers.get('x-error-kind', '?')}  "
+        f"attempts={headers.get(RETRY_COUNT_HEADER, 0)}  queue={headers.get(ORIGIN_QUEUE_HEADER)}"
+        f"\n    url={payload.get('url')}  email={payload.get('email')}"
+        f"\n    error={headers.get('x-last-error')}"
+    )
+
+
+def _job_id(message: aio_pika.abc.AbstractIncomingMessage) -> str | None:
+    try:
+        return json.loads(message.body.decode()).get("job_id")
+    except ValueError:
+        return None
+
+
+async def _run(command: str, limit: int, job_ids: set[str]) -> None:
+    connection = await aio_pika.connect_robust(settings.rabbitmq_url)
+    try:
+        channel = await connection.channel(publisher_confirms=True)
+        await channel.set_qos(prefetch_count=limit)
+        queue = await channel.declare_queue(settings.dead_letter_queue, durable=True)
+        held: list[aio_pika.abc.AbstractIncomingMessage] = []
+        replayed = 0
+        try:
+            while len(held) + replayed < limit:
+                message = await queue.get(no_ack=False, fail=False)
+                if message is None:
+                    break
+                if command == "list":
+                    print(_describe(message))
+                    held.append(message)
+                    continue
+                if job_ids and _job_id(message) not in job_ids:
+                    held.append(message)
+                    continue
+                headers = {
+                    k: v
+                    for k, v in (message.headers or {}).items()
+                    if k not in (RETRY_COUNT_HEADER, ORIGIN_QUEUE_HEADER)
+                }
+                await channel.default_exchange.publish(
+                    aio_pika.Message(
+                        body=message.body,
+                        content_type=message.content_type or "application/json",
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                        headers=headers,
+                    ),
+                    routing_key=(message.headers or {}).get(
+                        ORIGIN_QUEUE_HEADER, settings.audio_in_queue
+                    ),
+                )
+                await message.ack()
+                replayed += 1
+                print(f"replayed {_job_id(message)}")
+        finally:
+            for message in held:
+                await message.nack(requeue=True)
+        if command == "replay":
+            print(f"{replayed} message(s) replayed")
+    finally:
+        await connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or replay dead-lettered jobs")
+    parser.add_argument("command", choices=["list", "replay"])
+    parser.add_argument("--limit", type=int, default=100, help="messages to scan at most")
+    parser.add_argument("--job-id", action="append", default=[], help="replay only these jobs")
+    args = parser.parse_args()
+    asyncio.run(_run(args.command, args.limit, set(args.job_id)))
+
+
+if __name__ == "__main__":
+    main()
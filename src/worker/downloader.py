@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from http import HTTPStatus
+from pathlib import Path
+
+import aiohttp
+from aiohttp import ClientTimeout
+
+from config import settings
+from logging_config import logger
+from retry import PermanentError, TransientError
+
+# Errors after which the rest of the body can be fetched with a Range request.
+_RESUMABLE_ERRORS = (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, TimeoutError)
+
+Sink = Callable[[bytes, int], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class ByteRange:
+    """Bytes ``start..end`` (inclusive; None reads to the end of the body) of one version of
+    a source, pinned by its ``validator``. Without a validator a drop can't be resumed."""
+
+    start: int = 0
+    end: int | None = None
+    validator: str | None = None
+
+
+def download_timeout() -> ClientTimeout:
+    # No total deadline: a slow but moving download is fine, a stalled one trips sock_read
+    # and is resumed where it stopped.
+    return ClientTimeout(total=None, sock_connect=30, sock_read=settings.download_read_timeout)
+
+
+def check_declared_size(resp: aiohttp.ClientResponse) -> None:
+    """Reject oversized sources from their Content-Length before reading any of the body."""
+    limit = settings.max_download_bytes
+    if limit and resp.content_length is not None and resp.content_length > limit:
+        raise PermanentError(f"Source is {resp.content_length} bytes; the limit is {limit}")
+
+
+def _check_running_size(received: int, limit: int | None = None) -> None:
+    limit = settings.max_download_bytes if limit is None else limit
+    if limit and received > limit:
+        raise PermanentError(f"Source exceeds the {limit} byte limit")
+
+
+def _body_length(resp: aiohttp.ClientResponse) -> int | None:
+    # With a Content-Encoding, Content-Length counts encoded bytes while aiohttp hands us
+    # decoded ones, so the length (and byte ranges) can't be related to what we read.
+    if resp.headers.get("Content-Encoding", "identity").lower() != "identity":
+        return None
+    return resp.content_length
+
+
+def range_validator(resp: aiohttp.ClientResponse) -> str | None:
+    """The If-Range value pinning later range requests to this version of the source.
+
+    Without one (or without ``Accept-Ranges: bytes``) a resumed request could splice two
+    different versions of the file together, so such sources are fetched in one piece.
+    """
+    if resp.headers.get("Accept-Ranges", "").lower() != "bytes" or _body_length(resp) is None:
+        return None
+    etag = resp.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return resp.headers.get("Last-Modified")
+
+
+async def _open_range(
+    session: aiohttp.ClientSession, url: str, start: int, end: int, validator: str
+) -> aiohttp.ClientResponse:
+    resp = await session.get(
+        url,
+        headers={"Range": f"bytes={start}-{end}", "If-Range": validator},
+        timeout=download_timeout(),
+    )
+    content_range = resp.headers.get("Content-Range", "")
+    if resp.status == HTTPStatus.PARTIAL_CONTENT and content_range.startswith(f"bytes {start}-"):
+        return resp
+    resp.release()
+    if resp.status == HTTPStatus.OK:
+        # If-Range failed: the source changed under us. Start the job over.
+        raise TransientError("Source changed during download")
+    resp.raise_for_status()
+    raise TransientError(f"Unexpected response to range request: HTTP {resp.status}")
+
+
+async def fetch(
+    session: aiohttp.ClientSession,
+    url: str,
+    sink: Sink,
+    span: ByteRange,
+    first: aiohttp.ClientResponse | None = None,
+) -> int:
+    """Feed ``span`` of ``url`` to ``sink(chunk, offset)``, resuming after drops.
+
+    ``first`` is an already open response positioned at ``span.start``; otherwise a range
+    request is made. Returns the offset one past the last byte delivered.
+    """
+    end, validator = span.end, span.validator
+    pos = span.start
+    resumes = 0
+    resp = first
+    while True:
+        try:
+            if resp is None:
+                assert validator is not None and end is not None
+                resp = await _open_range(session, url, pos, end, validator)
+            async for received in resp.content.iter_chunked(settings.download_chunk_size):
+                # Never hand the sink bytes past the end of the span.
+                chunk = received if end is None else received[: end + 1 - pos]
+                await sink(chunk, pos)
+                pos += len(chunk)
+            if end is not None and pos <= end:
+                raise aiohttp.ClientPayloadError(f"Connection closed at byte {pos} of {end + 1}")
+            return pos
+        except _RESUMABLE_ERRORS as exc:
+            if validator is None or end is None or resumes >= settings.download_max_resumes:
+                raise
+            resumes += 1
+            logger.warning(
+                f"Download interrupted at byte {pos} ({exc!r}); "
+                f"resuming ({resumes}/{settings.download_max_resumes})"
+            )
+        finally:
+            if resp is not None:
+                resp.release()
+                resp = None
+
+
+def _hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(1 << 20):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _plan_ranges(size: int) -> list[tuple[int, int]]:
+    count = max(1, min(settings.download_parallelism, size // settings.download_chunk_size))
+    length = -(-size // count)
+    return [(start, min(start + length, size) - 1) for start in range(0, size, length)]
+
+
+async def _download_parallel(
+    session: aiohttp.ClientSession, url: str, path: Path, size: int, validator: str
+) -> None:
+    ranges = _plan_ranges(size)
+    logger.info(f"Downloading {size} bytes in {len(ranges)} parallel ranges")
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        os.ftruncate(fd, size)
+
+        async def write_at(chunk: bytes, offset: int) -> None:
+            os.pwrite(fd, chunk, offset)
+
+        fetches = [
+            asyncio.create_task(fetch(session, url, write_at, ByteRange(start, end, validator)))
+            for start, end in ranges
+        ]
+        try:
+            await asyncio.gather(*fetches)
+        except BaseException:
+            for task in fetches:
+                task.cancel()
+            await asyncio.gather(*fetches, return_exceptions=True)
+            raise
+    finally:
+        os.close(fd)
+
+
+async def download_to_file(
+    session: aiohttp.ClientSession,
+    resp: aiohttp.ClientResponse,
+    path: Path,
+    limit: int | None = None,
+) -> str:
+    """Save the body of ``resp`` to ``path``; returns its SHA-256 hex digest.
+
+    Large sources that support ranges are fetched in parallel byte ranges (the open response
+    is dropped unread); everything else is read from ``resp`` and resumed on disconnect.
+    ``limit`` overrides MAX_DOWNLOAD_BYTES for sources that didn't declare a length.
+    """
+    url = str(resp.url)
+    size = _body_length(resp)
+    validator = range_validator(resp)
+    if (
+        validator is not None
+        and size is not None
+        and settings.download_parallelism > 1
+        and size >= settings.download_parallel_min_bytes
+    ):
+        resp.release()
+        await _download_parallel(session, url, path, size, validator)
+        return await asyncio.to_thread(_hash_file, path)
+
+    hasher = hashlib.sha256()
+    with path.open("wb") as out:
+
+        async def write(chunk: bytes, offset: int) -> None:
+            _check_running_size(offset + len(chunk), limit)
+            # Disk writes are small and buffered; keep them inline.
+            hasher.update(chunk)
+            out.write(chunk)
+
+        end = size - 1 if size is not None else None
+        await fetch(session, url, write, ByteRange(0, end, validator), first=resp)
+    return hasher.hexdigest()
+
+
+async def feed_stream(
+    session: aiohttp.ClientSession, resp: aiohttp.ClientResponse, sink: Sink
+) -> None:
+    """Stream the body of ``resp`` into ``sink``, resuming on disconnect and enforcing the
+    size limit for sources that didn't declare a length."""
+    size = _body_length(resp)
+
+    async def limited(chunk: bytes, offset: int) -> None:
+        _check_running_size(offset + len(chunk))
+        await sink(chunk, offset)
+
+    end = size - 1 if size is not None else None
+    span = ByteRange(0, end, range_validator(resp))
+    await fetch(session, str(resp.url), limited, span, first=resp)
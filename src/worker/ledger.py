@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any
+
+from botocore.exceptions import ClientError
+
+from config import settings
+
+
+class JobLedger:
+    """Per-job progress markers in the bucket, keyed by the gateway's job ID.
+
+    RabbitMQ delivers at least once, so a job can come back after its MP3 was uploaded or even
+    after the user was notified (a worker dying before its ack, a retry racing a slow first
+    attempt). The ledger lets a redelivery skip the steps that already happened. Markers are
+    tiny; expire the prefix with a bucket lifecycle rule.
+    """
+
+    def __init__(self, s3: Any, bucket: str, prefix: str) -> None:
+        self._s3 = s3
+        self._bucket = bucket
+        self._prefix = prefix.strip("/")
+
+    def _key(self, job_id: str) -> str:
+        return f"{self._prefix}/{job_id}.json"
+
+    def _get_blocking(self, job_id: str) -> dict[str, Any] | None:
+        try:
+            obj = self._s3.get_object(Bucket=self._bucket, Key=self._key(job_id))
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in {"404", "NoSuchKey", "NotFound"}:
+                return None
+            raise
+        return json.loads(obj["Body"].read())
+
+    async def get(self, job_id: str) -> dict[str, Any] | None:
+        return await asyncio.to_thread(self._get_blocking, job_id)
+
+    async def mark(self, job_id: str, **state: Any) -> None:
+        await asyncio.to_thread(
+            self._s3.put_object,
+            Bucket=self._bucket,
+            Key=self._key(job_id),
+            Body=json.dumps(state).encode(),
+            ContentType="application/json",
+        )
+
+
+def create_ledger(s3: Any) -> JobLedger:
+    return JobLedger(s3, settings.minio_bucket_name, settings.jobs_prefix)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import shutil
+import time
+from collections.abc import Awaitable, Callable
+
+import aio_pika
+from aiohttp import web
+
+from logging_config import logger
+from scratch import scratch_roots
+
+
+def sweep_scratch() -> int:
+    """Empty the scratch directories of files left by a previous, killed process."""
+    removed = 0
+    for root in scratch_roots():
+        if not root.is_dir():
+            continue
+        for entry in root.iterdir():
+            try:
+                if entry.is_dir() and not entry.is_symlink():
+                    shutil.rmtree(entry)
+                else:
+                    entry.unlink()
+                removed += 1
+            except OSError:
+                logger.warning(f"Failed to remove stale temp entry {entry}", exc_info=True)
+    return removed
+
+
+async def check_binaries() -> None:
+    """Fail fast if ffmpeg or ffprobe is missing or broken, before taking any job."""
+    for binary in ("ffmpeg", "ffprobe"):
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                binary,
+                "-version",
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            rc = await proc.wait()
+        except OSError as exc:
+            raise RuntimeError(f"{binary} is not runnable: {exc}") from exc
+        if rc != 0:
+            raise RuntimeError(f"{binary} -version exited with {rc}")
+
+
+class Health:
+    """Probe endpoints for the metrics server.
+
+    ``/livez`` answers as long as the event loop does. ``/readyz`` answers once the worker is
+    consuming, and fails while draining or while the broker connection is down.
+    """
+
+    def __init__(self) -> None:
+        self.connection: aio_pika.abc.AbstractRobustConnection | None = None
+        self.ready = False
+
+    async def _livez(self, _: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def _readyz(self, _: web.Request) -> web.Response:
+        if not self.ready:
+            raise web.HTTPServiceUnavailable(text="not consuming")
+        if self.connection is None or self.connection.is_closed:
+            raise web.HTTPServiceUnavailable(text="broker connection down")
+        return web.Response(text="ok")
+
+    def routes(self) -> list[web.AbstractRouteDef]:
+        return [web.get("/livez", self._livez), web.get("/readyz", self._readyz)]
+
+
+class InFlight:
+    """Tracks running consumer callbacks so shutdown can wait for them and cancel the rest."""
+
+    def __init__(self) -> None:
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def track(
+        self, callback: Callable[[aio_pika.abc.AbstractIncomingMessage], Awaitable[None]]
+    ) -> Callable[[aio_pika.abc.AbstractIncomingMessage], Awaitable[None]]:
+        async def tracked(message: aio_pika.abc.AbstractIncomingMessage) -> None:
+            task = asyncio.current_task()
+            assert task is not None
+            self._tasks.add(task)
+            try:
+                await callback(message)
+            finally:
+                self._tasks.discard(task)
+
+        return tracked
+
+    async def drain(self, timeout: float) -> int:
+        """Wait up to ``timeout`` seconds for callbacks to finish; cancel and return the
+        number of those still running. Cancelled jobs requeue their message."""
+        deadline = time.monotonic() + timeout
+        while self._tasks and (remaining := deadline - time.monotonic()) > 0:
+            await asyncio.wait(set(self._tasks), timeout=remaining)
+        stragglers = set(self._tasks)
+        for task in stragglers:
+            task.cancel()
+        await asyncio.gather(*stragglers, return_exceptions=True)
+        return len(stragglers)
@@ -2,106 +2,572 @@ from __future__ import annotations
 
 import asyncio
 import json
-import tempfile
+import signal
+import time
+import uuid
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from functools import partial
 from pathlib import Path
+from typing import Any
 
 import aio_pika
 import aiohttp
-import boto3
-from aiohttp import ClientTimeout
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
 
+from batches import BatchInfo
+from cache import content_key, url_key
+from capacity import publish_heartbeats, record_job
 from config import settings
+from downloader import check_declared_size, download_timeout, download_to_file
+from lifecycle import Health, InFlight, check_binaries, sweep_scratch
 from logging_config import logger
+from metrics import (
+    DOWNLOAD_BYTES_PER_SECOND,
+    FFMPEG_REALTIME_FACTOR,
+    FREE_SLOTS,
+    JOBS,
+    JOBS_IN_PROGRESS,
+    QUEUE_WAIT_SECONDS,
+    STAGE_SECONDS,
+    start_metrics_server,
+)
+from profiles import (
+    PASSTHROUGH_ARGS,
+    EncodingProfile,
+    MediaInfo,
+    can_passthrough,
+    get_profile,
+    probe,
+)
+from resources import WorkerResources, open_resources
+from retry import (
+    RerouteError,
+    dead_letter,
+    declare_retry_topology,
+    defer,
+    is_transient,
+    reroute,
+    retry_count,
+    retry_delay,
+    schedule_retry,
+)
+from scheduling import BULK, INTERACTIVE, SlotsClosedError
+from scratch import ScratchJob, download_limit
+from segmented import convert_segmented, should_segment
+from status import JobStatusReporter
+from streaming import UploadTarget, convert_streaming, is_pipeable, is_probably_mp3
+from tracing import extract_context, inject_headers, setup_tracing, tracer
 
 
-async def process_message(message: aio_pika.abc.AbstractIncomingMessage) -> None:
-    async with message.process(requeue=False):
+async def _convert(
+    input_path: Path, output_path: Path, ffmpeg_args: list[str], ffmpeg_slots: asyncio.Semaphore
+) -> None:
+    async with ffmpeg_slots:
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-y",
+            "-i",
+            str(input_path),
+            *ffmpeg_args,
+            str(output_path),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
         try:
-            payload = json.loads(message.body.decode())
-            url = payload["url"]
-            user_name = payload.get("name")
-            user_email = payload.get("email")
-
-            # Download file
-            async with aiohttp.ClientSession() as session:
-                timeout = ClientTimeout(total=120)
-                async with session.get(url, timeout=timeout) as resp:
-                    resp.raise_for_status()
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".bin") as in_file:
-                        while True:
-                            chunk = await resp.content.read(1 << 15)
-                            if not chunk:
-                                break
-                            in_file.write(chunk)
-                        input_path = Path(in_file.name)
-
-            # Convert to mp3 using ffmpeg
-            output_path = Path(tempfile.mkstemp(suffix=".mp3")[1])
-            cmd = f'ffmpeg -y -i "{input_path}" -vn -ar 44100 -ac 2 -b:a 192k "{output_path}"'
-            proc = await asyncio.create_subprocess_shell(
-                cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
-            )
             rc = await proc.wait()
-            if rc != 0 or not output_path.exists() or output_path.stat().st_size == 0:
-                raise RuntimeError("ffmpeg conversion failed")
-
-            # Upload to S3 (MinIO)
-            s3 = boto3.client(
-                "s3",
-                endpoint_url=settings.minio_url,
-                aws_access_key_id=settings.minio_access_key,
-                aws_secret_access_key=settings.minio_secret_key,
-            )
+        except BaseException:
+            # Cancelled (e.g. draining on shutdown): don't leave ffmpeg running.
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+    if rc != 0 or not output_path.exists() or output_path.stat().st_size == 0:
+        raise RuntimeError("ffmpeg conversion failed")
 
-            object_key = f"{user_email}/{output_path.name}"
-            s3.upload_file(
-                str(output_path),
-                settings.minio_bucket_name,
-                object_key,
-                ExtraArgs={"ContentType": "audio/mpeg"},
-            )
 
-            # Publish to audio_out
-            connection = await aio_pika.connect_robust(settings.rabbitmq_url)
-            async with connection:
-                channel = await connection.channel()
-                await channel.declare_queue(settings.mp3_out_queue, durable=True)
-                out_message = {
-                    "name": user_name,
-                    "email": user_email,
-                    "file_key": object_key,
-                }
-                await channel.default_exchange.publish(
-                    aio_pika.Message(
-                        body=json.dumps(out_message).encode(),
-                        content_type="application/json",
-                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-                    ),
-                    routing_key=settings.mp3_out_queue,
-                )
+def _upload_blocking(s3: Any, output_path: Path, object_key: str) -> None:
+    s3.upload_file(
+        str(output_path),
+        settings.minio_bucket_name,
+        object_key,
+        ExtraArgs={"ContentType": "audio/mpeg"},
+    )
 
+
+async def _publish(
+    channel: aio_pika.abc.AbstractChannel, out_message: dict[str, str | None]
+) -> None:
+    # The channel has publisher confirms on, so this returns once the broker has the message.
+    await channel.default_exchange.publish(
+        aio_pika.Message(
+            body=json.dumps(out_message).encode(),
+            content_type="application/json",
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            headers=inject_headers(),
+        ),
+        routing_key=settings.mp3_out_queue,
+    )
+
+
+def _output_estimate(
+    info: MediaInfo | None, profile: EncodingProfile, input_bytes: int, mode: str
+) -> int:
+    if mode == "passthrough" or info is None or not info.duration:
+        return input_bytes
+    # CBR size plus a little for headers; the VBR ceiling is an upper bound too.
+    output = int(info.duration * profile.bitrate_kbps * 125 * 1.05)
+    # Segmented encodes hold the parts and the joined file at once.
+    return 2 * output if mode == "segmented" else output
+
+
+@dataclass(frozen=True)
+class _Job:
+    """One conversion: the source, where its result goes and how to encode it."""
+
+    url: str
+    object_key: str
+    profile: EncodingProfile
+    resources: WorkerResources
+    report: JobStatusReporter
+    queue: str
+
+    @property
+    def encode_args(self) -> list[str]:
+        return self.profile.ffmpeg_args()
+
+
+@dataclass(frozen=True)
+class _Source:
+    """A source downloaded into the job's scratch directory, with its cache keys."""
+
+    scratch: ScratchJob
+    path: Path
+    size: int
+    by_url: str | None
+    by_content: str
+
+
+async def _run_job(job: _Job) -> None:
+    """Download, convert and upload one source to ``job.object_key``."""
+    # Holds the job's scratch directory, removed on every way out of this function.
+    async with AsyncExitStack() as stack:
+        await job.report("downloading")
+        source = await _fetch_source(job, stack)
+        if source is None or await _reuse_converted(job, source):
+            return
+        output_path = await _convert_source(job, source)
+        await _upload(job, source, output_path)
+
+
+async def _fetch_source(job: _Job, stack: AsyncExitStack) -> _Source | None:
+    """Download the source to scratch space, or return None if the job was served without it."""
+    cache = job.resources.cache
+    async with job.resources.http.get(job.url, timeout=download_timeout()) as resp:
+        resp.raise_for_status()
+        check_declared_size(resp)
+        _check_route(job, resp.content_length)
+        by_url = url_key(job.url, resp.headers, job.encode_args) if cache else None
+        if await _reuse_by_url(job, by_url):
+            return None
+
+        # Likely-MP3 inputs take the file path so ffprobe can decide on passthrough, and so do
+        # VBR profiles: ffmpeg writes their Xing/LAME header by seeking back, which a pipe can't.
+        if (
+            settings.streaming_pipeline
+            and job.profile.mode == "cbr"
+            and is_pipeable(resp)
+            and not is_probably_mp3(resp)
+        ):
+            await _stream(job, resp, by_url)
+            return None
+
+        # Input plus an output of about the same size, until ffprobe tells us better.
+        size = resp.content_length
+        expected = 2 * size if size is not None else None
+        scratch = job.resources.scratch.try_reserve(expected)
+        if scratch is not None:
+            await stack.enter_async_context(scratch)
+            return await _download(job, resp, scratch, by_url)
+
+    # No room yet. Wait for it with the source connection closed, then fetch again.
+    scratch = await stack.enter_async_context(await job.resources.scratch.reserve(expected))
+    async with job.resources.http.get(job.url, timeout=download_timeout()) as resp:
+        resp.raise_for_status()
+        check_declared_size(resp)
+        by_url = url_key(job.url, resp.headers, job.encode_args) if cache else None
+        return await _download(job, resp, scratch, by_url)
+
+
+def _check_route(job: _Job, size: int | None) -> None:
+    # The gateway doesn't fetch user URLs, so this is the first look at the real size. Moving
+    # now, before any scratch space or ffmpeg time, keeps big files off the interactive queue.
+    if (
+        job.queue == settings.audio_in_queue
+        and settings.bulk_threshold_bytes > 0
+        and size is not None
+        and size >= settings.bulk_threshold_bytes
+    ):
+        raise RerouteError(settings.audio_in_bulk_queue)
+
+
+async def _reuse_by_url(job: _Job, by_url: str | None) -> bool:
+    cache = job.resources.cache
+    if not cache or not by_url:
+        return False
+    cached = await cache.lookup_url(by_url)
+    if cached is None:
+        return False
+    # Same URL, same validators: the body has not changed, don't fetch it.
+    await cache.copy_to(cached, job.object_key)
+    return True
+
+
+async def _stream(job: _Job, resp: aiohttp.ClientResponse, by_url: str | None) -> None:
+    # Conversion starts with the first bytes; nothing touches local disk.
+    resources = job.resources
+    await job.report("converting")
+    with tracer.start_as_current_span("stream"), STAGE_SECONDS.labels("stream").time():
+        digest = await convert_streaming(
+            resources.http,
+            resp,
+            UploadTarget(resources.s3, job.object_key),
+            job.encode_args,
+            resources.limits.ffmpeg,
+        )
+    if resources.cache:
+        await resources.cache.store(job.object_key, content_key(digest, job.encode_args), by_url)
+
+
+async def _download(
+    job: _Job, resp: aiohttp.ClientResponse, scratch: ScratchJob, by_url: str | None
+) -> _Source:
+    path = scratch.file("input")
+    started = time.perf_counter()
+    with tracer.start_as_current_span("download"):
+        digest = await download_to_file(job.resources.http, resp, path, limit=download_limit())
+    elapsed = time.perf_counter() - started
+    size = path.stat().st_size
+    # Sources of unknown length were admitted on an estimate; account for the real size.
+    scratch.resize(2 * size)
+    STAGE_SECONDS.labels("download").observe(elapsed)
+    DOWNLOAD_BYTES_PER_SECOND.observe(size / max(elapsed, 1e-6))
+    return _Source(scratch, path, size, by_url, content_key(digest, job.encode_args))
+
+
+async def _reuse_converted(job: _Job, source: _Source) -> bool:
+    cache = job.resources.cache
+    if not cache:
+        return False
+    cached = await cache.lookup_content(source.by_content)
+    if cached is None:
+        return False
+    await cache.copy_to(cached, job.object_key)
+    if source.by_url:
+        await cache.link_url(source.by_url, cached)
+    return True
+
+
+async def _convert_source(job: _Job, source: _Source) -> Path:
+    await job.report("converting")
+    info = await probe(source.path)
+    if can_passthrough(info, job.profile):
+        mode, args = "passthrough", PASSTHROUGH_ARGS
+    elif info is not None and should_segment(info.duration):
+        mode, args = "segmented", job.encode_args
+    else:
+        mode, args = "encode", job.encode_args
+    source.scratch.resize(source.size + _output_estimate(info, job.profile, source.size, mode))
+    output_path = source.scratch.file("output.mp3")
+    ffmpeg = job.resources.limits.ffmpeg
+    started = time.perf_counter()
+    with tracer.start_as_current_span("convert") as span:
+        span.set_attribute("app.convert_mode", mode)
+        if mode == "passthrough":
+            logger.info(f"Input already fits profile {job.profile.name}; copying audio stream")
+        if mode == "segmented":
+            assert info is not None and info.duration is not None
+            await convert_segmented(source.path, output_path, info.duration, args, ffmpeg)
+        else:
+            await _convert(source.path, output_path, args, ffmpeg)
+    elapsed = time.perf_counter() - started
+    STAGE_SECONDS.labels("convert").observe(elapsed)
+    if info is not None and info.duration:
+        FFMPEG_REALTIME_FACTOR.labels(mode).observe(info.duration / max(elapsed, 1e-6))
+    return output_path
+
+
+async def _upload(job: _Job, source: _Source, output_path: Path) -> None:
+    await job.report("uploading")
+    with tracer.start_as_current_span("upload"), STAGE_SECONDS.labels("upload").time():
+        # boto3 is blocking; run it in a thread so other jobs keep downloading meanwhile.
+        await asyncio.to_thread(_upload_blocking, job.resources.s3, output_path, job.object_key)
+    if job.resources.cache:
+        await job.resources.cache.store(job.object_key, source.by_content, source.by_url)
+
+
+async def _finish_batch_item(
+    resources: WorkerResources,
+    batch: BatchInfo,
+    payload: dict,
+    object_key: str | None,
+    error: str | None = None,
+) -> None:
+    # Batch items don't notify individually; the item that completes the batch zips all of
+    # them and sends the one notification.
+    user_email = payload.get("email")
+    file_keys = await resources.archiver.record(batch, payload["job_id"], object_key, error)
+    if file_keys is None:
+        return
+    if not file_keys:
+        logger.error(f"Every item of batch {batch.batch_id} failed; nothing to archive")
+        return
+    archive_key = await resources.archiver.build_archive(batch, user_email, file_keys)
+    await _publish(
+        resources.publish_channel,
+        {"name": payload.get("name"), "email": user_email, "file_key": archive_key},
+    )
+
+
+def _peek_email(message: aio_pika.abc.AbstractIncomingMessage) -> str | None:
+    try:
+        return json.loads(message.body.decode()).get("email")
+    except Exception:
+        return None
+
+
+def _observe_queue_wait(message: aio_pika.abc.AbstractIncomingMessage, job_class: str) -> None:
+    # Retried deliveries would count their backoff delay as queue wait; leave them out.
+    if message.timestamp is None or retry_count(message):
+        return
+    enqueued = message.timestamp
+    if enqueued.tzinfo is None:
+        enqueued = enqueued.replace(tzinfo=UTC)
+    wait = (datetime.now(tz=UTC) - enqueued).total_seconds()
+    QUEUE_WAIT_SECONDS.labels(job_class).observe(max(0.0, wait))
+
+
+async def process_message(
+    message: aio_pika.abc.AbstractIncomingMessage,
+    resources: WorkerResources,
+    job_class: str,
+    origin_queue: str,
+) -> None:
+    limits = resources.limits
+    owner = _peek_email(message)
+    if not limits.users.try_acquire(owner):
+        # This user already has their share of slots here; park the job in the delay queue so
+        # other jobs (here or on another worker) go first, without holding a slot meanwhile.
+        async with message.process(requeue=True):
+            await defer(resources.publish_channel, message, origin_queue)
+        return
+    try:
+        # Job failures are handled (retried or dead-lettered) inside; anything escaping is a
+        # broker problem while doing so, and the job must not be lost to it.
+        async with limits.jobs.slot(job_class), message.process(requeue=True):
+            _observe_queue_wait(message, job_class)
+            JOBS_IN_PROGRESS.inc()
             try:
-                input_path.unlink(missing_ok=True)
-            except Exception:
-                logger.warning(f"Failed to delete temp file {input_path}", exc_info=True)
-            try:
-                Path(output_path).unlink(missing_ok=True)
-            except Exception:
-                logger.warning(f"Failed to delete temp file {output_path}", exc_info=True)
+                with tracer.start_as_current_span(
+                    f"process {origin_queue}",
+                    context=extract_context(message.headers),
+                    kind=SpanKind.CONSUMER,
+                    attributes={
+                        "messaging.system": "rabbitmq",
+                        "messaging.destination.name": origin_queue,
+                        "app.job_class": job_class,
+                        "app.retry_count": retry_count(message),
+                    },
+                ):
+                    started = time.perf_counter()
+                    await _handle(message, resources, origin_queue)
+                    record_job(time.perf_counter() - started)
+            finally:
+                JOBS_IN_PROGRESS.dec()
+    except SlotsClosedError:
+        # Shutting down before this job got a slot; hand it to another worker.
+        await message.nack(requeue=True)
+    finally:
+        limits.users.release(owner)
+
+
+@dataclass
+class _Delivery:
+    """A job message being handled, and as much of the job as was read before any failure."""
+
+    message: aio_pika.abc.AbstractIncomingMessage
+    origin_queue: str
+    payload: dict = field(default_factory=dict)
+    batch: BatchInfo | None = None
+    report: JobStatusReporter | None = None
 
-        except Exception as exc:
-            logger.error(f"Failed to process message: {exc}")
+
+async def _handle(
+    message: aio_pika.abc.AbstractIncomingMessage,
+    resources: WorkerResources,
+    origin_queue: str,
+) -> None:
+    delivery = _Delivery(message, origin_queue)
+    try:
+        delivery.payload = payload = json.loads(message.body.decode())
+        user_name = payload.get("name")
+        user_email = payload.get("email")
+        job_id = payload.get("job_id")
+        delivery.batch = batch = BatchInfo.from_payload(payload)
+        if job_id:
+            trace.get_current_span().set_attribute("app.job_id", job_id)
+        delivery.report = report = JobStatusReporter(resources.status_exchange, job_id, user_email)
+
+        progress = await resources.ledger.get(job_id) if job_id else None
+        if progress and progress.get("notified"):
+            logger.info(f"Job {job_id} was already completed; dropping redelivery")
+            JOBS.labels("duplicate").inc()
+            return
+        if progress and progress.get("file_key"):
+            # Uploaded before a crash or retry; only the notification is missing.
+            object_key = progress["file_key"]
+        else:
+            # Keyed by job ID so a redelivery overwrites rather than duplicates its upload.
+            object_key = f"{user_email}/{job_id or uuid.uuid4().hex}.mp3"
+            profile = get_profile(payload.get("profile"))
+            job = _Job(payload["url"], object_key, profile, resources, report, origin_queue)
+            await _run_job(job)
+            if job_id:
+                await resources.ledger.mark(job_id, file_key=object_key)
+
+        if batch is not None:
+            await _finish_batch_item(resources, batch, payload, object_key)
+        else:
+            await _publish(
+                resources.publish_channel,
+                {"name": user_name, "email": user_email, "file_key": object_key},
+            )
+        if job_id:
+            await resources.ledger.mark(job_id, file_key=object_key, notified=True)
+        await report("done", file_key=object_key)
+        JOBS.labels("done").inc()
+    except RerouteError as exc:
+        logger.info(f"Moving job {delivery.payload.get('job_id')} to {exc.queue}")
+        await reroute(resources.publish_channel, message, exc.queue)
+        JOBS.labels("rerouted").inc()
+    except Exception as exc:
+        await _handle_failure(delivery, resources, exc)
+
+
+async def _handle_failure(delivery: _Delivery, resources: WorkerResources, exc: Exception) -> None:
+    message, report, batch = delivery.message, delivery.report, delivery.batch
+    error = str(exc) or type(exc).__name__
+    transient = is_transient(exc)
+    span = trace.get_current_span()
+    span.record_exception(exc)
+    span.set_status(Status(StatusCode.ERROR, error))
+    span.set_attribute("app.error_transient", transient)
+    attempt = retry_count(message) + 1
+    if transient and attempt <= settings.retry_max_attempts:
+        logger.warning(
+            f"Transient failure ({error}); retry {attempt}/{settings.retry_max_attempts} "
+            f"in {retry_delay(attempt):.0f}s"
+        )
+        await schedule_retry(
+            resources.publish_channel, message, delivery.origin_queue, attempt, error
+        )
+        JOBS.labels("retried").inc()
+        if report is not None:
+            await report("retrying", attempt=attempt, error=error)
+        return
+
+    kind = "transient, retries exhausted" if transient else "permanent"
+    logger.error(f"Failed to process message ({kind}): {error}")
+    await dead_letter(resources.publish_channel, message, delivery.origin_queue, error, transient)
+    JOBS.labels("dead_lettered").inc()
+    if report is not None:
+        await report("failed", error=error)
+    if batch is not None:
+        try:
+            await _finish_batch_item(resources, batch, delivery.payload, None, error)
+        except Exception:
+            logger.error(f"Failed to record failed batch item {batch.batch_id}", exc_info=True)
 
 
 async def run() -> None:
+    logger.info(
+        f"Concurrency: prefetch={settings.prefetch_count} jobs={settings.max_concurrent_jobs} "
+        f"ffmpeg={settings.ffmpeg_concurrency} weights={settings.interactive_weight}:"
+        f"{settings.bulk_weight} per_user={settings.per_user_max_jobs or 'unlimited'}"
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Warm start: everything a job needs is checked or connected before the first delivery.
+    removed = sweep_scratch()
+    if removed:
+        logger.info(f"Removed {removed} stale scratch entries")
+    await check_binaries()
+    tracer_provider = setup_tracing()
+    health = Health()
+    metrics_runner = await start_metrics_server(settings.metrics_port, health.routes())
     connection = await aio_pika.connect_robust(settings.rabbitmq_url)
-    channel = await connection.channel()
-    queue = await channel.declare_queue(settings.audio_in_queue, durable=True)
-    await queue.consume(process_message, no_ack=False)
+    health.connection = connection
+    in_flight = InFlight()
     try:
-        await asyncio.Future()
+        async with open_resources(connection) as resources:
+            await asyncio.to_thread(resources.s3.head_bucket, Bucket=settings.minio_bucket_name)
+            # One channel per queue so each class has its own prefetch window, split by weight;
+            # the weighted slots then decide which buffered job runs next.
+            queues = {
+                INTERACTIVE: (settings.audio_in_queue, settings.interactive_weight),
+                BULK: (settings.audio_in_bulk_queue, settings.bulk_weight),
+            }
+            total_weight = sum(weight for _, weight in queues.values())
+            await declare_retry_topology(
+                resources.publish_channel, [name for name, _ in queues.values()]
+            )
+            consumers = []
+            for job_class, (queue_name, weight) in queues.items():
+                channel = await connection.channel()
+                prefetch = max(1, settings.prefetch_count * weight // total_weight)
+                await channel.set_qos(prefetch_count=prefetch)
+                queue = await channel.declare_queue(queue_name, durable=True)
+                callback = partial(
+                    process_message,
+                    resources=resources,
+                    job_class=job_class,
+                    origin_queue=queue_name,
+                )
+                tag = await queue.consume(in_flight.track(callback), no_ack=False)
+                consumers.append((queue, tag))
+            FREE_SLOTS.set_function(lambda: resources.limits.jobs.free)
+            heartbeats = asyncio.create_task(
+                publish_heartbeats(resources.publish_channel, resources.limits.jobs)
+            )
+            health.ready = True
+            logger.info("Worker ready")
+
+            await stop.wait()
+            health.ready = False
+            heartbeats.cancel()
+            logger.info(
+                f"Draining: waiting up to {settings.drain_timeout_seconds:.0f}s for running jobs"
+            )
+            for queue, tag in consumers:
+                await queue.cancel(tag)
+            # Deliveries still waiting for a slot are requeued right away.
+            resources.limits.jobs.close()
+            cancelled = await in_flight.drain(settings.drain_timeout_seconds)
+            if cancelled:
+                logger.warning(f"Cancelled and requeued {cancelled} jobs at the drain deadline")
     finally:
+        # Anything still unacknowledged goes back to the queue when the connection closes.
         await connection.close()
+        await metrics_runner.cleanup()
+        if tracer_provider is not None:
+            tracer_provider.shutdown()
+    logger.info("Worker stopped")
 
 
 def main() -> None:
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from logging_config import logger
+
+CACHE_LOOKUPS = Counter(
+    "worker_cache_lookups_total",
+    "Conversion cache lookups by key kind and outcome.",
+    ["kind", "result"],
+)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "worker_queue_wait_seconds",
+    "Time from the gateway enqueueing a job to a worker slot picking it up (first attempts).",
+    ["job_class"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+STAGE_SECONDS = Histogram(
+    "worker_stage_seconds",
+    "Wall time of each job stage; convert includes waiting for an ffmpeg slot.",
+    ["stage"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+DOWNLOAD_BYTES_PER_SECOND = Histogram(
+    "worker_download_bytes_per_second",
+    "Source download throughput on the temp-file path.",
+    buckets=tuple(2**n * 64 * 1024 for n in range(12)),
+)
+FFMPEG_REALTIME_FACTOR = Histogram(
+    "worker_ffmpeg_realtime_factor",
+    "Seconds of audio converted per second of conversion wall time.",
+    ["mode"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+JOBS = Counter("worker_jobs_total", "Finished deliveries by outcome.", ["outcome"])
+JOBS_IN_PROGRESS = Gauge("worker_jobs_in_progress", "Jobs holding a job slot.")
+FREE_SLOTS = Gauge("worker_free_job_slots", "Job slots not held by a running job.")
+SCRATCH_QUOTA_BYTES = Gauge("worker_scratch_quota_bytes", "Scratch quota (0 = none).", ["tier"])
+SCRATCH_RESERVED_BYTES = Gauge(
+    "worker_scratch_reserved_bytes", "Scratch bytes reserved by running jobs.", ["tier"]
+)
+SCRATCH_FREE_BYTES = Gauge(
+    "worker_scratch_free_bytes", "Free space on the scratch filesystem.", ["tier"]
+)
+SCRATCH_WAIT_SECONDS = Histogram(
+    "worker_scratch_wait_seconds",
+    "Time jobs waited for scratch space at admission.",
+    ["tier"],
+    buckets=(0.01, 0.1, 1, 5, 10, 30, 60, 120, 300),
+)
+
+# Exported by scaler.py.
+SCALER_QUEUE_DEPTH = Gauge("scaler_queue_messages", "Ready messages per queue.", ["queue"])
+SCALER_QUEUE_CONSUMERS = Gauge("scaler_queue_consumers", "Consumers per queue.", ["queue"])
+SCALER_WORKERS = Gauge("scaler_workers", "Workers with a recent capacity heartbeat.")
+SCALER_WORKER_FREE_SLOTS = Gauge(
+    "scaler_worker_free_slots", "Free job slots per worker, from heartbeats.", ["worker"]
+)
+SCALER_SLOTS = Gauge("scaler_job_slots", "Job slots across live workers.", ["state"])
+SCALER_JOB_SECONDS = Gauge("scaler_job_seconds", "Estimated wall time of one job.")
+SCALER_DRAIN_SECONDS = Gauge(
+    "scaler_drain_seconds", "Estimated time for the current workers to clear the backlog."
+)
+SCALER_DESIRED_WORKERS = Gauge(
+    "scaler_desired_workers", "Workers needed to clear the backlog within the target time."
+)
+
+
+async def _metrics(_: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+async def start_metrics_server(
+    port: int, routes: Iterable[web.AbstractRouteDef] = ()
+) -> web.AppRunner:
+    """Serve ``/metrics`` (plus any extra ``routes``) on a side port; the consumer itself has
+    no HTTP interface."""
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    app.add_routes(routes)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host="0.0.0.0", port=port).start()  # noqa: S104
+    logger.info(f"Metrics listening on :{port}")
+    return runner
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal
+
+from retry import PermanentError
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    name: str
+    mode: Literal["cbr", "vbr"]
+    sample_rate: int
+    channels: int
+    bitrate_kbps: int
+    # LAME VBR quality (0 best .. 9 smallest); only used in "vbr" mode, where bitrate_kbps is
+    # the ceiling we accept for passthrough rather than an encoder setting.
+    vbr_quality: int = 2
+
+    def ffmpeg_args(self) -> list[str]:
+        args = [
+            "-vn",
+            "-c:a",
+            "libmp3lame",
+            "-ar",
+            str(self.sample_rate),
+            "-ac",
+            str(self.channels),
+        ]
+        if self.mode == "vbr":
+            return [*args, "-q:a", str(self.vbr_quality)]
+        return [*args, "-b:a", f"{self.bitrate_kbps}k"]
+
+
+PROFILES: dict[str, EncodingProfile] = {
+    profile.name: profile
+    for profile in (
+        EncodingProfile("standard", "cbr", sample_rate=44100, channels=2, bitrate_kbps=192),
+        EncodingProfile("high", "cbr", sample_rate=44100, channels=2, bitrate_kbps=320),
+        EncodingProfile("voice", "cbr", sample_rate=22050, channels=1, bitrate_kbps=64),
+        EncodingProfile(
+            "vbr", "vbr", sample_rate=44100, channels=2, bitrate_kbps=256, vbr_quality=2
+        ),
+    )
+}
+DEFAULT_PROFILE = "standard"
+
+# Copy the first audio stream as-is; drops video and cover-art streams.
+PASSTHROUGH_ARGS = ["-map", "0:a:0", "-c:a", "copy", "-map_metadata", "0"]
+
+
+def get_profile(name: str | None) -> EncodingProfile:
+    """Look up a job's profile; jobs that don't name one get DEFAULT_PROFILE.
+
+    This table is the only list of profiles: the gateway passes names through unchecked, so an
+    unknown name fails the job rather than silently encoding it some other way.
+    """
+    if name is None:
+        return PROFILES[DEFAULT_PROFILE]
+    profile = PROFILES.get(name)
+    if profile is None:
+        raise PermanentError(f"Unknown encoding profile {name!r}")
+    return profile
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    format_name: str
+    codec_name: str | None
+    sample_rate: int | None
+    channels: int | None
+    bit_rate: int | None
+    duration: float | None
+
+
+def _int_or_none(value: str | float | None) -> int | None:
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+async def probe(path: Path) -> MediaInfo | None:
+    """Inspect the first audio stream with ffprobe; None if the file can't be probed."""
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe",
+        "-v",
+        "error",
+        "-print_format",
+        "json",
+        "-show_format",
+        "-show_streams",
+        "-select_streams",
+        "a:0",
+        str(path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return None
+    try:
+        data = json.loads(stdout)
+    except ValueError:
+        return None
+    fmt = data.get("format", {})
+    streams = data.get("streams") or [{}]
+    stream = streams[0]
+    duration = fmt.get("duration") or stream.get("duration")
+    return MediaInfo(
+        format_name=fmt.get("format_name", ""),
+        codec_name=stream.get("codec_name"),
+        sample_rate=_int_or_none(stream.get("sample_rate")),
+        channels=_int_or_none(stream.get("channels")),
+        bit_rate=_int_or_none(stream.get("bit_rate")) or _int_or_none(fmt.get("bit_rate")),
+        duration=float(duration) if duration else None,
+    )
+
+
+def can_passthrough(info: MediaInfo | None, profile: EncodingProfile) -> bool:
+    """True if the input is already an MP3 no richer than the profile asks for.
+
+    Re-encoding such a file only costs CPU and adds a second generation of lossy artefacts.
+    """
+    if info is None or info.codec_name != "mp3" or "mp3" not in info.format_name.split(","):
+        return False
+    return (
+        info.sample_rate is not None
+        and info.channels is not None
+        and info.bit_rate is not None
+        and info.sample_rate <= profile.sample_rate
+        and info.channels <= profile.channels
+        and info.bit_rate <= profile.bitrate_kbps * 1000
+    )
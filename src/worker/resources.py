@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any
+
+import aio_pika
+import aiohttp
+import boto3
+from botocore.config import Config
+
+from batches import BatchArchiver, create_archiver
+from cache import ConversionCache
+from config import settings
+from ledger import JobLedger, create_ledger
+from logging_config import logger
+from scheduling import BULK, INTERACTIVE, UserCaps, WeightedSlots
+from scratch import ScratchSpace, create_scratch
+
+
+@dataclass(frozen=True)
+class JobLimits:
+    """Bounds on jobs in flight (shared fairly between job classes), jobs per user and
+    ffmpeg processes alive at once."""
+
+    jobs: WeightedSlots
+    users: UserCaps
+    ffmpeg: asyncio.Semaphore
+
+
+@dataclass(frozen=True)
+class WorkerResources:
+    """Clients shared by every job for the lifetime of the worker process."""
+
+    http: aiohttp.ClientSession
+    s3: Any
+    publish_channel: aio_pika.abc.AbstractChannel
+    status_exchange: aio_pika.abc.AbstractExchange
+    limits: JobLimits
+    cache: ConversionCache | None
+    archiver: BatchArchiver
+    ledger: JobLedger
+    scratch: ScratchSpace
+
+
+def create_s3_client() -> Any:
+    # boto3 clients are thread-safe; size the urllib3 pool so concurrent uploads
+    # running in worker threads don't queue for a connection.
+    return boto3.client(
+        "s3",
+        endpoint_url=settings.minio_url,
+        aws_access_key_id=settings.minio_access_key,
+        aws_secret_access_key=settings.minio_secret_key,
+        config=Config(max_pool_connections=max(10, settings.max_concurrent_jobs * 2)),
+    )
+
+
+@asynccontextmanager
+async def open_resources(
+    connection: aio_pika.abc.AbstractRobustConnection,
+) -> AsyncIterator[WorkerResources]:
+    connector = aiohttp.TCPConnector(
+        limit=settings.http_pool_size, ttl_dns_cache=settings.http_dns_cache_ttl
+    )
+    http = aiohttp.ClientSession(connector=connector)
+    s3 = await asyncio.to_thread(create_s3_client)
+    publish_channel = await connection.channel(publisher_confirms=True)
+    await publish_channel.declare_queue(settings.mp3_out_queue, durable=True)
+    status_exchange = await publish_channel.declare_exchange(
+        settings.job_status_exchange, aio_pika.ExchangeType.FANOUT, durable=True
+    )
+
+    scratch = create_scratch()
+    resources = WorkerResources(
+        http=http,
+        s3=s3,
+        publish_channel=publish_channel,
+        status_exchange=status_exchange,
+        limits=JobLimits(
+            jobs=WeightedSlots(
+                settings.max_concurrent_jobs,
+                {INTERACTIVE: settings.interactive_weight, BULK: settings.bulk_weight},
+            ),
+            users=UserCaps(settings.per_user_max_jobs),
+            ffmpeg=asyncio.Semaphore(settings.ffmpeg_concurrency),
+        ),
+        cache=(
+            ConversionCache(s3, settings.minio_bucket_name, settings.cache_prefix)
+            if settings.cache_enabled
+            else None
+        ),
+        archiver=create_archiver(s3, scratch),
+        ledger=create_ledger(s3),
+        scratch=scratch,
+    )
+    try:
+        yield resources
+    finally:
+        logger.info("Closing shared worker resources")
+        try:
+            await publish_channel.close()
+        except Exception:
+            logger.warning("Failed to close publish channel", exc_info=True)
+        await http.close()
+        s3.close()
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import time
+from http import HTTPStatus
+from typing import Any
+
+import aio_pika
+import aiohttp
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+from config import settings
+
+RETRY_COUNT_HEADER = "x-retry-count"
+ORIGIN_QUEUE_HEADER = "x-origin-queue"
+
+# Any 5xx is transient, and so are these 4xx responses.
+_TRANSIENT_HTTP_STATUSES = frozenset(
+    {HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_EARLY, HTTPStatus.TOO_MANY_REQUESTS}
+)
+_TRANSIENT_S3_CODES = frozenset(
+    {"SlowDown", "RequestTimeout", "ServiceUnavailable", "InternalError", "Throttling"}
+)
+_TRANSIENT_ERROR_TYPES = (
+    TimeoutError
+    | ConnectionError
+    | aiohttp.ClientConnectionError
+    | aiohttp.ClientPayloadError
+    | BotoConnectionError
+    | HTTPClientError
+    | aio_pika.exceptions.AMQPConnectionError
+)
+# Error text kept in message headers.
+_MAX_ERROR_LENGTH = 1000
+
+
+class TransientError(Exception):
+    """A failure worth retrying later (the same job may well succeed)."""
+
+
+class PermanentError(Exception):
+    """A failure no retry will fix, e.g. a source that isn't decodable audio."""
+
+
+class RerouteError(Exception):
+    """The job belongs on another queue, e.g. a large source that arrived as interactive."""
+
+    def __init__(self, queue: str) -> None:
+        super().__init__(f"belongs on {queue}")
+        self.queue = queue
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Classify a job failure. Anything not recognisably transient is treated as permanent."""
+    if isinstance(exc, TransientError):
+        return True
+    if isinstance(exc, PermanentError):
+        return False
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return (
+            exc.status >= HTTPStatus.INTERNAL_SERVER_ERROR or exc.status in _TRANSIENT_HTTP_STATUSES
+        )
+    if isinstance(exc, ClientError):
+        error = exc.response.get("Error", {})
+        status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return (
+            status >= HTTPStatus.INTERNAL_SERVER_ERROR or error.get("Code") in _TRANSIENT_S3_CODES
+        )
+    return isinstance(exc, _TRANSIENT_ERROR_TYPES)
+
+
+def retry_count(message: aio_pika.abc.AbstractIncomingMessage) -> int:
+    try:
+        return int((message.headers or {}).get(RETRY_COUNT_HEADER, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def retry_delay(attempt: int) -> float:
+    """Backoff before retry number ``attempt`` (1-based)."""
+    return settings.retry_base_delay * settings.retry_backoff_factor ** (attempt - 1)
+
+
+def retry_queue_name(origin_queue: str, attempt: int) -> str:
+    return f"{origin_queue}.retry.{attempt}"
+
+
+def defer_queue_name(origin_queue: str) -> str:
+    return f"{origin_queue}.defer"
+
+
+async def declare_retry_topology(
+    channel: aio_pika.abc.AbstractChannel, origin_queues: list[str]
+) -> None:
+    """Declare one delay queue per (origin queue, attempt), one per origin queue for deferred
+    jobs, plus the shared dead-letter queue.
+
+    A retried message sits in its delay queue until the queue TTL expires, then RabbitMQ
+    dead-letters it straight back onto the origin queue. Per-queue TTLs (rather than
+    per-message ones) matter: RabbitMQ only expires messages at the head of a queue.
+    """
+    for origin in origin_queues:
+        for attempt in range(1, settings.retry_max_attempts + 1):
+            await channel.declare_queue(
+                retry_queue_name(origin, attempt),
+                durable=True,
+                arguments={
+                    "x-message-ttl": int(retry_delay(attempt) * 1000),
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": origin,
+                },
+            )
+        await channel.declare_queue(
+            defer_queue_name(origin),
+            durable=True,
+            arguments={
+                "x-message-ttl": int(settings.per_user_defer_seconds * 1000),
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": origin,
+            },
+        )
+    await channel.declare_queue(settings.dead_letter_queue, durable=True)
+
+
+def _copy(
+    message: aio_pika.abc.AbstractIncomingMessage, headers: dict[str, Any]
+) -> aio_pika.Message:
+    return aio_pika.Message(
+        body=message.body,
+        content_type=message.content_type or "application/json",
+        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        headers={**(message.headers or {}), **headers},
+        timestamp=message.timestamp,
+    )
+
+
+async def schedule_retry(
+    channel: aio_pika.abc.AbstractChannel,
+    message: aio_pika.abc.AbstractIncomingMessage,
+    origin_queue: str,
+    attempt: int,
+    error: str,
+) -> None:
+    await channel.default_exchange.publish(
+        _copy(message, {RETRY_COUNT_HEADER: attempt, "x-last-error": error[:_MAX_ERROR_LENGTH]}),
+        routing_key=retry_queue_name(origin_queue, attempt),
+    )
+
+
+async def defer(
+    channel: aio_pika.abc.AbstractChannel,
+    message: aio_pika.abc.AbstractIncomingMessage,
+    origin_queue: str,
+) -> None:
+    """Put a job aside for PER_USER_DEFER_SECONDS; unlike a retry, it isn't counted as one."""
+    await channel.default_exchange.publish(
+        _copy(message, {}), routing_key=defer_queue_name(origin_queue)
+    )
+
+
+async def reroute(
+    channel: aio_pika.abc.AbstractChannel,
+    message: aio_pika.abc.AbstractIncomingMessage,
+    queue: str,
+) -> None:
+    """Move a job to another work queue as it is; it hasn't started, so it isn't a retry."""
+    await channel.default_exchange.publish(_copy(message, {}), routing_key=queue)
+
+
+async def dead_letter(
+    channel: aio_pika.abc.AbstractChannel,
+    message: aio_pika.abc.AbstractIncomingMessage,
+    origin_queue: str,
+    error: str,
+    transient: bool,
+) -> None:
+    await channel.default_exchange.publish(
+        _copy(
+            message,
+            {
+                ORIGIN_QUEUE_HEADER: origin_queue,
+                "x-last-error": error[:_MAX_ERROR_LENGTH],
+                "x-error-kind": "transient" if transient else "permanent",
+                "x-failed-at": time.time(),
+            },
+        ),
+        routing_key=settings.dead_letter_queue,
+    )
@@ -0,0 +1,166 @@
+"""Autoscaling signals for the worker deployment.
+
+    python scaler.py
+
+Runs from the worker image as its own single-replica deployment. It polls the depth of the
+job queues and collects the workers' capacity heartbeats, then serves the result on
+METRICS_PORT, both as Prometheus gauges on ``/metrics`` and as JSON on ``/scaling`` for
+KEDA's metrics-api scaler. ``desired_workers`` is the number of workers needed to clear the
+backlog within SCALER_TARGET_DRAIN_SECONDS while keeping the running jobs going.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import time
+from typing import Any
+
+import aio_pika
+from aiohttp import web
+
+from config import settings
+from logging_config import logger
+from metrics import (
+    SCALER_DESIRED_WORKERS,
+    SCALER_DRAIN_SECONDS,
+    SCALER_JOB_SECONDS,
+    SCALER_QUEUE_CONSUMERS,
+    SCALER_QUEUE_DEPTH,
+    SCALER_SLOTS,
+    SCALER_WORKER_FREE_SLOTS,
+    SCALER_WORKERS,
+    start_metrics_server,
+)
+
+JOB_QUEUES = (settings.audio_in_queue, settings.audio_in_bulk_queue)
+
+
+class CapacityView:
+    """Latest heartbeat per worker; workers silent for three intervals are considered gone."""
+
+    def __init__(self) -> None:
+        self._workers: dict[str, dict[str, Any]] = {}
+
+    def update(self, beat: dict[str, Any]) -> None:
+        # Judge freshness by our own clock, not the worker's.
+        self._workers[beat["worker"]] = {**beat, "received": time.monotonic()}
+
+    def live(self) -> dict[str, dict[str, Any]]:
+        cutoff = time.monotonic() - settings.capacity_interval_seconds * 3
+        for worker in [w for w, beat in self._workers.items() if beat["received"] < cutoff]:
+            del self._workers[worker]
+            SCALER_WORKER_FREE_SLOTS.remove(worker)
+        return self._workers
+
+
+def estimate(queues: dict[str, dict[str, int]], workers: dict[str, dict[str, Any]]) -> dict:
+    backlog = sum(queues[name]["messages"] for name in JOB_QUEUES if name in queues)
+    capacity = sum(beat["capacity"] for beat in workers.values())
+    free = sum(beat["free"] for beat in workers.values())
+    busy = capacity - free
+
+    # Median job time per worker, weighted by how many jobs it is based on.
+    samples = [(beat["job_seconds"], beat["samples"]) for beat in workers.values()]
+    samples = [(seconds, n) for seconds, n in samples if seconds is not None and n]
+    job_seconds = (
+        sum(seconds * n for seconds, n in samples) / sum(n for _, n in samples)
+        if samples
+        else settings.scaler_default_job_seconds
+    )
+    slots_per_worker = capacity / len(workers) if workers else settings.max_concurrent_jobs
+
+    # Slots needed to finish the backlog in the target time, on top of the ones in use.
+    needed_slots = busy + backlog * job_seconds / settings.scaler_target_drain_seconds
+    return {
+        "queues": queues,
+        "workers": len(workers),
+        "slots": {"total": capacity, "free": free, "busy": busy},
+        "free_slots": {worker: beat["free"] for worker, beat in workers.items()},
+        "backlog": backlog,
+        "job_seconds": round(job_seconds, 2),
+        "drain_seconds": round(backlog * job_seconds / capacity, 1) if capacity else None,
+        "desired_workers": math.ceil(needed_slots / slots_per_worker),
+    }
+
+
+def _export(signals: dict) -> None:
+    for name, queue in signals["queues"].items():
+        SCALER_QUEUE_DEPTH.labels(name).set(queue["messages"])
+        SCALER_QUEUE_CONSUMERS.labels(name).set(queue["consumers"])
+    SCALER_WORKERS.set(signals["workers"])
+    for worker, free in signals["free_slots"].items():
+        SCALER_WORKER_FREE_SLOTS.labels(worker).set(free)
+    for state in ("free", "busy"):
+        SCALER_SLOTS.labels(state).set(signals["slots"][state])
+    SCALER_JOB_SECONDS.set(signals["job_seconds"])
+    # With no workers there is no drain time; report infinity when work is waiting.
+    drain = signals["drain_seconds"]
+    if drain is None:
+        drain = math.inf if signals["backlog"] else 0
+    SCALER_DRAIN_SECONDS.set(drain)
+    SCALER_DESIRED_WORKERS.set(signals["desired_workers"])
+
+
+async def _queue_depths(channel: aio_pika.abc.AbstractChannel) -> dict[str, dict[str, int]]:
+    depths = {}
+    for name in (*JOB_QUEUES, settings.mp3_out_queue):
+        # Passive declares only inspect; they never create a queue with the wrong arguments.
+        queue = await channel.declare_queue(name, passive=True)
+        result = queue.declaration_result
+        depths[name] = {"messages": result.message_count, "consumers": result.consumer_count}
+    return depths
+
+
+async def run() -> None:
+    view = CapacityView()
+    signals: dict = {}
+
+    async def scaling(_: web.Request) -> web.Response:
+        if not signals:
+            raise web.HTTPServiceUnavailable(text="no queue data yet")
+        return web.json_response(signals)
+
+    metrics_runner = await start_metrics_server(
+        settings.metrics_port, [web.get("/scaling", scaling)]
+    )
+    connection = await aio_pika.connect_robust(settings.rabbitmq_url)
+    try:
+        channel = await connection.channel()
+        exchange = await channel.declare_exchange(
+            settings.capacity_exchange, aio_pika.ExchangeType.FANOUT
+        )
+        heartbeats = await channel.declare_queue(exclusive=True, auto_delete=True)
+        await heartbeats.bind(exchange)
+
+        async def on_heartbeat(message: aio_pika.abc.AbstractIncomingMessage) -> None:
+            try:
+                view.update(json.loads(message.body.decode()))
+            except (ValueError, KeyError):
+                logger.warning("Ignoring malformed capacity heartbeat")
+
+        await heartbeats.consume(on_heartbeat, no_ack=True)
+        # A passive declare of a missing queue closes the channel, so polls get their own.
+        poll_channel = await connection.channel()
+        while True:
+            try:
+                if poll_channel.is_closed:
+                    poll_channel = await connection.channel()
+                signals = estimate(await _queue_depths(poll_channel), view.live())
+                _export(signals)
+            except Exception as exc:
+                logger.warning(f"Failed to refresh scaling signals: {exc}")
+            await asyncio.sleep(settings.scaler_poll_seconds)
+    finally:
+        await connection.close()
+        await metrics_runner.cleanup()
+
+
+def main() -> None:
+    logger.info("Scaler starting")
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
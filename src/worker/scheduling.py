@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class SlotsClosedError(Exception):
+    """Raised to waiters, and to later acquirers, once the worker starts draining."""
+
+
+class WeightedSlots:
+    """A semaphore whose waiters are served per job class by smooth weighted round-robin.
+
+    With weights ``{"interactive": 4, "bulk": 1}`` and both classes waiting, four of every
+    five freed slots go to interactive jobs, yet bulk jobs are never starved outright.
+    """
+
+    def __init__(self, capacity: int, weights: dict[str, int]) -> None:
+        self.capacity = capacity
+        self._free = capacity
+        self._closed = False
+        self._weights = weights
+        self._credit = dict.fromkeys(weights, 0)
+        self._waiters: dict[str, deque[asyncio.Future[None]]] = {cls: deque() for cls in weights}
+
+    @property
+    def free(self) -> int:
+        return self._free
+
+    def _pick(self) -> str | None:
+        eligible = [cls for cls, waiters in self._waiters.items() if waiters]
+        if not eligible:
+            return None
+        total = sum(self._weights[cls] for cls in eligible)
+        for cls in eligible:
+            self._credit[cls] += self._weights[cls]
+        chosen = max(eligible, key=lambda cls: self._credit[cls])
+        self._credit[chosen] -= total
+        return chosen
+
+    def _release(self) -> None:
+        while (cls := self._pick()) is not None:
+            waiter = self._waiters[cls].popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._free += 1
+
+    def close(self) -> None:
+        """Stop handing out slots; held slots stay valid until released."""
+        self._closed = True
+        for waiters in self._waiters.values():
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_exception(SlotsClosedError())
+
+    async def _acquire(self, cls: str) -> None:
+        if self._closed:
+            raise SlotsClosedError
+        if self._free > 0 and not any(self._waiters.values()):
+            self._free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[cls].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # We were handed a slot just as we got cancelled; pass it on.
+                self._release()
+            else:
+                with contextlib.suppress(ValueError):
+                    self._waiters[cls].remove(waiter)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, cls: str) -> AsyncIterator[None]:
+        await self._acquire(cls)
+        try:
+            yield
+        finally:
+            self._release()
+
+
+class UserCaps:
+    """Counts running jobs per user; a limit of 0 disables the cap."""
+
+    def __init__(self, limit: int) -> None:
+        self._limit = limit
+        self._running: dict[str, int] = {}
+
+    def try_acquire(self, user: str | None) -> bool:
+        if self._limit <= 0 or not user:
+            return True
+        if self._running.get(user, 0) >= self._limit:
+            return False
+        self._running[user] = self._running.get(user, 0) + 1
+        return True
+
+    def release(self, user: str | None) -> None:
+        if self._limit <= 0 or not user:
+            return
+        remaining = self._running.get(user, 0) - 1
+        if remaining > 0:
+            self._running[user] = remaining
+        else:
+            self._running.pop(user, None)
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import shutil
+import tempfile
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from config import settings
+from logging_config import logger
+from metrics import (
+    SCRATCH_FREE_BYTES,
+    SCRATCH_QUOTA_BYTES,
+    SCRATCH_RESERVED_BYTES,
+    SCRATCH_WAIT_SECONDS,
+)
+from retry import PermanentError, TransientError
+
+DISK = "disk"
+MEMORY = "memory"
+
+
+class _Tier:
+    """One scratch directory and the bytes reserved in it; a quota of 0 is unlimited."""
+
+    def __init__(self, name: str, root: Path, quota: int) -> None:
+        self.name = name
+        self.root = root
+        self.quota = quota
+        self.reserved = 0
+        SCRATCH_QUOTA_BYTES.labels(name).set(quota)
+        SCRATCH_RESERVED_BYTES.labels(name).set_function(lambda: self.reserved)
+        SCRATCH_FREE_BYTES.labels(name).set_function(self._free_bytes)
+
+    def _free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(self.root).free
+        except OSError:
+            return 0
+
+    def fits(self, nbytes: int) -> bool:
+        return not self.quota or self.reserved + nbytes <= self.quota
+
+
+class ScratchJob:
+    """A job's private scratch directory and its byte reservation.
+
+    Used as an async context manager; leaving it removes the directory and everything in it
+    and returns the reservation.
+    """
+
+    def __init__(self, space: ScratchSpace, tier: _Tier, path: Path, reserved: int) -> None:
+        self._space = space
+        self.tier = tier
+        self.path = path
+        self.reserved = reserved
+
+    async def __aenter__(self) -> ScratchJob:
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        self.release()
+
+    def file(self, name: str) -> Path:
+        return self.path / name
+
+    def resize(self, nbytes: int) -> None:
+        """Adjust the reservation once the real sizes are known.
+
+        Growing never waits: the job was already admitted, and waiting while holding space
+        could deadlock jobs against each other. The tier may briefly run over its quota;
+        admission of new jobs catches up as they finish. Only the per-job quota is hard.
+        """
+        limit = settings.scratch_job_quota_bytes
+        if limit and nbytes > limit:
+            raise PermanentError(f"Job needs {nbytes} bytes of scratch space; the limit is {limit}")
+        self._space._adjust(self.tier, nbytes - self.reserved)
+        self.reserved = nbytes
+
+    def release(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._space._adjust(self.tier, -self.reserved)
+        self.reserved = 0
+
+
+class ScratchSpace:
+    """Byte-accounted scratch space for jobs.
+
+    Each job gets its own directory, removed with everything in it when the job ends however
+    it ends. Jobs expected to need at most ``memory_max_bytes`` go to the memory tier (a tmpfs)
+    when it has room; the rest go to disk. Admission waits for the tier's quota to allow the
+    job's estimate, up to SCRATCH_WAIT_SECONDS, then fails the attempt as transient so the
+    job is retried, possibly on a worker with more room.
+    """
+
+    def __init__(self, disk: _Tier, memory: _Tier | None, memory_max_bytes: int) -> None:
+        self._disk = disk
+        self._memory = memory
+        self._memory_max_bytes = memory_max_bytes
+        self._freed = asyncio.Event()
+
+    def _adjust(self, tier: _Tier, delta: int) -> None:
+        tier.reserved += delta
+        if delta < 0:
+            # Wake every waiter; each re-checks whether its tier now fits.
+            self._freed.set()
+            self._freed = asyncio.Event()
+
+    def _pick(self, nbytes: int | None) -> _Tier:
+        memory = self._memory
+        if (
+            memory is not None
+            and nbytes is not None
+            and nbytes <= self._memory_max_bytes
+            and memory.fits(nbytes)
+        ):
+            return memory
+        return self._disk
+
+    def _size(self, expected_bytes: int | None) -> int:
+        limit = settings.scratch_job_quota_bytes
+        nbytes = expected_bytes
+        if nbytes is None:
+            # Unknown until downloaded; the job resizes once it knows.
+            nbytes = settings.scratch_unknown_size_bytes
+            return min(nbytes, limit) if limit else nbytes
+        if limit and nbytes > limit:
+            raise PermanentError(f"Job needs {nbytes} bytes of scratch space; the limit is {limit}")
+        return nbytes
+
+    async def _admit(self, tier: _Tier, nbytes: int) -> None:
+        if tier.quota and nbytes > tier.quota:
+            raise PermanentError(f"Job needs {nbytes} bytes of scratch space; only {tier.quota}")
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(settings.scratch_wait_seconds):
+                while not tier.fits(nbytes):
+                    await self._freed.wait()
+        except TimeoutError:
+            raise TransientError(f"No {tier.name} scratch space for {nbytes} bytes") from None
+        finally:
+            SCRATCH_WAIT_SECONDS.labels(tier.name).observe(time.perf_counter() - started)
+        self._adjust(tier, nbytes)
+
+    def _open(self, tier: _Tier, nbytes: int) -> ScratchJob:
+        try:
+            path = Path(tempfile.mkdtemp(prefix="job-", dir=tier.root))
+        except BaseException:
+            self._adjust(tier, -nbytes)
+            raise
+        return ScratchJob(self, tier, path, nbytes)
+
+    def try_reserve(self, expected_bytes: int | None) -> ScratchJob | None:
+        """Reserve scratch space if the tier has room right now, without waiting."""
+        nbytes = self._size(expected_bytes)
+        tier = self._pick(expected_bytes)
+        if tier.quota and nbytes > tier.quota:
+            raise PermanentError(f"Job needs {nbytes} bytes of scratch space; only {tier.quota}")
+        if not tier.fits(nbytes):
+            return None
+        self._adjust(tier, nbytes)
+        return self._open(tier, nbytes)
+
+    async def reserve(self, expected_bytes: int | None) -> ScratchJob:
+        """Reserve ``expected_bytes`` (SCRATCH_UNKNOWN_SIZE_BYTES if unknown), waiting for room."""
+        nbytes = self._size(expected_bytes)
+        tier = self._pick(expected_bytes)
+        await self._admit(tier, nbytes)
+        return self._open(tier, nbytes)
+
+    @asynccontextmanager
+    async def job(self, expected_bytes: int | None) -> AsyncIterator[ScratchJob]:
+        """Reserve scratch space for the duration of the block."""
+        async with await self.reserve(expected_bytes) as job:
+            yield job
+
+
+def scratch_roots() -> list[Path]:
+    roots = [Path(settings.work_dir)]
+    if settings.scratch_memory_dir:
+        roots.append(Path(settings.scratch_memory_dir))
+    return roots
+
+
+def create_scratch() -> ScratchSpace:
+    for root in scratch_roots():
+        root.mkdir(parents=True, exist_ok=True)
+    disk = _Tier(DISK, Path(settings.work_dir), settings.scratch_disk_quota_bytes)
+    memory = None
+    if settings.scratch_memory_dir:
+        memory = _Tier(
+            MEMORY, Path(settings.scratch_memory_dir), settings.scratch_memory_quota_bytes
+        )
+    logger.info(
+        f"Scratch: disk={disk.root} quota={disk.quota or 'unlimited'} "
+        f"memory={memory.root if memory else 'off'} job_quota="
+        f"{settings.scratch_job_quota_bytes or 'unlimited'}"
+    )
+    return ScratchSpace(disk, memory, settings.scratch_memory_max_bytes)
+
+
+def download_limit() -> int:
+    """Bytes a source may put on disk: the lower of MAX_DOWNLOAD_BYTES and the per-job quota."""
+    limits = [n for n in (settings.max_download_bytes, settings.scratch_job_quota_bytes) if n]
+    return min(limits, default=0)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import shutil
+import tempfile
+from pathlib import Path
+
+from config import settings
+from logging_config import logger
+
+
+def plan_segments(duration: float) -> list[tuple[float, float | None]]:
+    """Split ``duration`` seconds into (start, length) pieces, at most one per ffmpeg slot.
+
+    The last piece has no length so it runs to the real end of the input, whatever rounding
+    or container-reported duration error there is.
+    """
+    count = min(
+        settings.ffmpeg_concurrency,
+        max(1, math.floor(duration / settings.segment_min_seconds)),
+    )
+    length = duration / count
+    return [(index * length, length if index < count - 1 else None) for index in range(count)]
+
+
+def _segment_args(
+    input_path: Path, start: float, length: float | None, ffmpeg_args: list[str], part: Path
+) -> list[str]:
+    args = ["-ss", f"{start:.6f}"]
+    if length is not None:
+        args += ["-t", f"{length:.6f}"]
+    return [*args, "-i", str(input_path), *ffmpeg_args, str(part)]
+
+
+async def _run_ffmpeg(args: list[str], ffmpeg_slots: asyncio.Semaphore) -> None:
+    async with ffmpeg_slots:
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            *args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            rc = await proc.wait()
+        except BaseException:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+    if rc != 0:
+        raise RuntimeError("ffmpeg conversion failed")
+
+
+async def convert_segmented(
+    input_path: Path,
+    output_path: Path,
+    duration: float,
+    ffmpeg_args: list[str],
+    ffmpeg_slots: asyncio.Semaphore,
+) -> None:
+    """Encode a long input as parallel segments and join them without re-encoding.
+
+    ``-ss`` before ``-i`` seeks the demuxer to the preceding keyframe and, because we
+    transcode, ffmpeg decodes and drops samples up to the exact timestamp, so segment edges
+    are sample accurate. Concatenation with ``-c copy`` is lossless; the only difference from
+    a sequential encode is each segment's encoder delay and padding at the joins (a few ms).
+    """
+    segments = plan_segments(duration)
+    logger.info(f"Encoding {duration:.0f}s input as {len(segments)} parallel segments")
+    workdir = Path(tempfile.mkdtemp(prefix="segments-", dir=output_path.parent))
+    try:
+        parts = [workdir / f"part-{index:04d}.mp3" for index in range(len(segments))]
+        encodes = [
+            asyncio.create_task(
+                _run_ffmpeg(
+                    _segment_args(input_path, start, length, ffmpeg_args, part), ffmpeg_slots
+                )
+            )
+            for (start, length), part in zip(segments, parts, strict=True)
+        ]
+        try:
+            await asyncio.gather(*encodes)
+        except BaseException:
+            # One failed segment fails the job; don't leave its siblings burning CPU.
+            for task in encodes:
+                task.cancel()
+            await asyncio.gather(*encodes, return_exceptions=True)
+            raise
+
+        playlist = workdir / "parts.txt"
+        playlist.write_text("".join(f"file '{part.name}'\n" for part in parts))
+        await _run_ffmpeg(
+            [
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                str(playlist),
+                "-c",
+                "copy",
+                str(output_path),
+            ],
+            ffmpeg_slots,
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not output_path.exists() or output_path.stat().st_size == 0:
+        raise RuntimeError("ffmpeg conversion failed")
+
+
+def should_segment(duration: float | None) -> bool:
+    return (
+        settings.segment_threshold_seconds > 0
+        and duration is not None
+        and duration >= settings.segment_threshold_seconds
+        and settings.ffmpeg_concurrency > 1
+    )
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import json
+import time
+from typing import Any
+
+import aio_pika
+
+from logging_config import logger
+
+
+class JobStatusReporter:
+    """Publishes a job's stage transitions to the status fanout exchange.
+
+    Status is advisory: a failed publish is logged and never fails the job. Messages without
+    a ``job_id`` (enqueued by an older gateway) report nothing.
+    """
+
+    def __init__(
+        self, exchange: aio_pika.abc.AbstractExchange, job_id: str | None, email: str | None
+    ) -> None:
+        self._exchange = exchange
+        self._job_id = job_id
+        self._email = email
+
+    async def __call__(self, stage: str, **extra: Any) -> None:
+        if not self._job_id:
+            return
+        event = {
+            "job_id": self._job_id,
+            "email": self._email,
+            "status": stage,
+            "at": time.time(),
+            **extra,
+        }
+        try:
+            await self._exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps(event).encode(),
+                    content_type="application/json",
+                    delivery_mode=aio_pika.DeliveryMode.NOT_PERSISTENT,
+                ),
+                routing_key="",
+            )
+        except Exception as exc:
+            logger.warning(f"Failed to publish status {stage} for job {self._job_id}: {exc}")
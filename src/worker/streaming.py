@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import Any
+from urllib.parse import urlparse
+
+import aiohttp
+
+from config import settings
+from downloader import feed_stream
+from logging_config import logger
+
+# Containers whose index may sit at the end of the file (MP4 "moov" atom) cannot be
+# decoded from a non-seekable pipe; those go through the temp-file path instead.
+_NON_PIPEABLE_CONTENT_TYPES = frozenset(
+    {
+        "video/mp4",
+        "audio/mp4",
+        "audio/x-m4a",
+        "audio/m4a",
+        "video/quicktime",
+        "video/3gpp",
+        "audio/3gpp",
+    }
+)
+_NON_PIPEABLE_SUFFIXES = frozenset({".mp4", ".m4a", ".m4b", ".m4v", ".mov", ".3gp", ".3g2"})
+
+_READ_CHUNK = 1 << 16
+
+
+def _content_type(resp: aiohttp.ClientResponse) -> str:
+    return resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+
+def _suffix(resp: aiohttp.ClientResponse) -> str:
+    return PurePosixPath(urlparse(str(resp.url)).path).suffix.lower()
+
+
+def is_pipeable(resp: aiohttp.ClientResponse) -> bool:
+    if _content_type(resp) in _NON_PIPEABLE_CONTENT_TYPES:
+        return False
+    return _suffix(resp) not in _NON_PIPEABLE_SUFFIXES
+
+
+def is_probably_mp3(resp: aiohttp.ClientResponse) -> bool:
+    return _content_type(resp) in {"audio/mpeg", "audio/mp3"} or _suffix(resp) == ".mp3"
+
+
+class MultipartUpload:
+    """S3 multipart upload fed with fixed-size parts; boto3 calls run in threads."""
+
+    def __init__(self, s3: Any, bucket: str, key: str, content_type: str) -> None:
+        self._s3 = s3
+        self._bucket = bucket
+        self._key = key
+        self._content_type = content_type
+        self._upload_id: str | None = None
+        self._parts: list[dict[str, Any]] = []
+
+    async def start(self) -> None:
+        resp = await asyncio.to_thread(
+            self._s3.create_multipart_upload,
+            Bucket=self._bucket,
+            Key=self._key,
+            ContentType=self._content_type,
+        )
+        self._upload_id = resp["UploadId"]
+
+    async def upload_part(self, data: bytes) -> None:
+        part_number = len(self._parts) + 1
+        # Reserve the slot before awaiting so part numbers stay ordered.
+        self._parts.append({"PartNumber": part_number})
+        resp = await asyncio.to_thread(
+            self._s3.upload_part,
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self._parts[part_number - 1]["ETag"] = resp["ETag"]
+
+    async def complete(self) -> None:
+        await asyncio.to_thread(
+            self._s3.complete_multipart_upload,
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+
+    async def abort(self) -> None:
+        if self._upload_id is None:
+            return
+        try:
+            await asyncio.to_thread(
+                self._s3.abort_multipart_upload,
+                Bucket=self._bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+            )
+        except Exception:
+            logger.warning(f"Failed to abort multipart upload for {self._key}", exc_info=True)
+
+
+async def _feed_stdin(
+    session: aiohttp.ClientSession,
+    resp: aiohttp.ClientResponse,
+    stdin: asyncio.StreamWriter,
+    hasher: hashlib._Hash,
+) -> None:
+    async def write(chunk: bytes, offset: int) -> None:
+        hasher.update(chunk)
+        stdin.write(chunk)
+        await stdin.drain()
+
+    try:
+        await feed_stream(session, resp, write)
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg exited early; its return code tells us why.
+        pass
+    finally:
+        with contextlib.suppress(Exception):
+            stdin.close()
+
+
+async def _drain_stdout(stdout: asyncio.StreamReader, upload: MultipartUpload) -> int:
+    part_size = settings.upload_part_size
+    buffer = bytearray()
+    total = 0
+    # At most one part is uploading while the next one fills, so memory stays around
+    # two parts regardless of the input size.
+    pending: asyncio.Task[None] | None = None
+    try:
+        while True:
+            chunk = await stdout.read(_READ_CHUNK)
+            if not chunk:
+                break
+            buffer += chunk
+            total += len(chunk)
+            if len(buffer) >= part_size:
+                if pending is not None:
+                    await pending
+                part = bytes(buffer[:part_size])
+                del buffer[:part_size]
+                pending = asyncio.create_task(upload.upload_part(part))
+        if pending is not None:
+            await pending
+            pending = None
+        if buffer:
+            await upload.upload_part(bytes(buffer))
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+    return total
+
+
+@dataclass(frozen=True)
+class UploadTarget:
+    """The object a streamed conversion is uploaded to."""
+
+    s3: Any
+    object_key: str
+
+
+async def convert_streaming(
+    session: aiohttp.ClientSession,
+    resp: aiohttp.ClientResponse,
+    target: UploadTarget,
+    ffmpeg_args: list[str],
+    ffmpeg_slots: asyncio.Semaphore,
+) -> str:
+    """Pipe the response body through ffmpeg straight into a multipart upload.
+
+    Returns the SHA-256 hex digest of the input bytes.
+    """
+    hasher = hashlib.sha256()
+    upload = MultipartUpload(target.s3, settings.minio_bucket_name, target.object_key, "audio/mpeg")
+    async with ffmpeg_slots:
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            "pipe:0",
+            *ffmpeg_args,
+            "-f",
+            "mp3",
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        assert proc.stdin is not None
+        assert proc.stdout is not None
+        try:
+            await upload.start()
+            _, written = await asyncio.gather(
+                _feed_stdin(session, resp, proc.stdin, hasher),
+                _drain_stdout(proc.stdout, upload),
+            )
+            rc = await proc.wait()
+            if rc != 0 or written == 0:
+                raise RuntimeError("ffmpeg conversion failed")
+            await upload.complete()
+        except BaseException:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            await upload.abort()
+            raise
+    return hasher.hexdigest()
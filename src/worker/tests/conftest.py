@@ -0,0 +1,7 @@
+from __future__ import annotations
+
+import os
+
+# Settings are read at import time; give the required ones a value before any test imports.
+os.environ.setdefault("MINIO_ACCESS_KEY", "test")
+os.environ.setdefault("MINIO_SECRET_KEY", "test")
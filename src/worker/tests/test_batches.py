@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import io
+import zipfile
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from batches import BatchArchiver, BatchInfo
+from config import settings
+from scratch import create_scratch
+
+BUCKET = "mp3-converter"
+
+
+@pytest.fixture
+def s3() -> Iterator[Any]:
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def archiver(s3: Any, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> BatchArchiver:
+    monkeypatch.setattr(settings, "work_dir", str(tmp_path / "work"))
+    monkeypatch.setattr(settings, "scratch_memory_dir", "")
+    return BatchArchiver(s3, BUCKET, "_batches", create_scratch())
+
+
+async def test_only_the_item_completing_the_batch_gets_the_file_keys(
+    archiver: BatchArchiver,
+) -> None:
+    batch = BatchInfo(batch_id="b1", size=3)
+
+    assert await archiver.record(batch, "j1", "u/j1.mp3") is None
+    assert await archiver.record(batch, "j2", None, error="not audio") is None
+    keys = await archiver.record(batch, "j3", "u/j3.mp3")
+
+    assert keys == ["u/j1.mp3", "u/j3.mp3"]
+
+
+async def test_only_one_item_claims_the_batch(archiver: BatchArchiver) -> None:
+    batch = BatchInfo(batch_id="b1", size=2)
+    await archiver.record(batch, "j1", "u/j1.mp3")
+    assert await archiver.record(batch, "j2", "u/j2.mp3") is not None
+
+    # Another item seeing the full count later, e.g. a duplicate delivery, loses the claim.
+    assert await archiver.record(batch, "j1", "u/j1.mp3") is None
+
+
+async def test_redelivery_after_a_failed_archive_claims_the_batch_again(
+    archiver: BatchArchiver, s3: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    s3.put_object(Bucket=BUCKET, Key="u/j1.mp3", Body=b"first")
+    s3.put_object(Bucket=BUCKET, Key="u/j2.mp3", Body=b"second")
+    batch = BatchInfo(batch_id="b1", size=2)
+    await archiver.record(batch, "j1", "u/j1.mp3")
+    keys = await archiver.record(batch, "j2", "u/j2.mp3")
+    assert keys is not None
+
+    def fail(*_: Any) -> None:
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(archiver, "_build_zip", fail)
+        with pytest.raises(OSError, match="disk full"):
+            await archiver.build_archive(batch, "u", keys)
+
+    # The claimant is redelivered; it still owns the claim and carries on with the archive.
+    keys = await archiver.record(batch, "j2", "u/j2.mp3")
+    assert keys == ["u/j1.mp3", "u/j2.mp3"]
+    key = await archiver.build_archive(batch, "u", keys)
+    body = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        assert archive.namelist() == ["j1.mp3", "j2.mp3"]
+
+
+async def test_archive_is_built_in_scratch_space(archiver: BatchArchiver, s3: Any) -> None:
+    s3.put_object(Bucket=BUCKET, Key="u/a/song.mp3", Body=b"first")
+    s3.put_object(Bucket=BUCKET, Key="u/b/song.mp3", Body=b"second")
+    batch = BatchInfo(batch_id="b1", size=2)
+
+    key = await archiver.build_archive(batch, "u", ["u/a/song.mp3", "u/b/song.mp3"])
+
+    body = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        assert archive.namelist() == ["song.mp3", "1-song.mp3"]
+        assert archive.read("1-song.mp3") == b"second"
+    # The scratch job was released and its directory removed.
+    assert archiver._scratch._disk.reserved == 0
+    assert list(Path(settings.work_dir).iterdir()) == []
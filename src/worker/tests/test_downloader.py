@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import hashlib
+import itertools
+import re
+from pathlib import Path
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from config import settings
+from downloader import download_to_file
+from retry import TransientError
+
+BODY = bytes(range(256)) * 1024
+ETAG = '"v1"'
+_RANGE = re.compile(r"bytes=(\d+)-(\d+)")
+
+
+class Origin:
+    """A media server that honours If-Range requests and can drop its first full response."""
+
+    def __init__(self, *, ranges: bool = True, drop_at: int | None = None) -> None:
+        self.ranges = ranges
+        self.drop_at = drop_at
+        self.etag = ETAG
+        self.requests: list[str | None] = []
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        requested = request.headers.get("Range")
+        self.requests.append(requested)
+        headers = {"ETag": self.etag}
+        if self.ranges:
+            headers["Accept-Ranges"] = "bytes"
+        match = _RANGE.fullmatch(requested or "")
+        if match and self.ranges and request.headers.get("If-Range") == self.etag:
+            start, end = int(match[1]), int(match[2])
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(BODY)}"
+            return web.Response(status=206, body=BODY[start : end + 1], headers=headers)
+        if self.drop_at is None:
+            return web.Response(body=BODY, headers=headers)
+        # Promise the whole body, send part of it and hang up.
+        resp = web.StreamResponse(headers=headers)
+        resp.content_length = len(BODY)
+        await resp.prepare(request)
+        await resp.write(BODY[: self.drop_at])
+        self.drop_at = None
+        assert request.transport is not None
+        request.transport.close()
+        return resp
+
+
+@pytest.fixture
+def small_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "download_chunk_size", 16 * 1024)
+    monkeypatch.setattr(settings, "download_max_resumes", 2)
+
+
+async def _download(server_factory, origin: Origin, path: Path) -> str:
+    app = web.Application()
+    app.router.add_get("/media", origin.handle)
+    server = await server_factory(app)
+    async with aiohttp.ClientSession() as session, session.get(server.make_url("/media")) as resp:
+        return await download_to_file(session, resp, path)
+
+
+@pytest.mark.usefixtures("small_chunks")
+async def test_resumes_a_dropped_download_with_a_range_request(
+    aiohttp_server, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(settings, "download_parallelism", 1)
+    origin = Origin(drop_at=100_000)
+    path = tmp_path / "input"
+
+    digest = await _download(aiohttp_server, origin, path)
+
+    assert path.read_bytes() == BODY
+    assert digest == hashlib.sha256(BODY).hexdigest()
+    assert origin.requests[0] is None
+    assert len(origin.requests) == 2
+    resumed_from = int(_RANGE.fullmatch(origin.requests[1])[1])
+    assert 0 < resumed_from <= 100_000
+
+
+@pytest.mark.usefixtures("small_chunks")
+async def test_drop_without_range_support_fails(
+    aiohttp_server, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(settings, "download_parallelism", 1)
+    origin = Origin(ranges=False, drop_at=100_000)
+
+    with pytest.raises(aiohttp.ClientPayloadError):
+        await _download(aiohttp_server, origin, tmp_path / "input")
+    assert origin.requests == [None]
+
+
+@pytest.mark.usefixtures("small_chunks")
+async def test_large_sources_download_in_parallel_ranges(
+    aiohttp_server, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(settings, "download_parallelism", 4)
+    monkeypatch.setattr(settings, "download_parallel_min_bytes", 64 * 1024)
+    origin = Origin()
+    path = tmp_path / "input"
+
+    digest = await _download(aiohttp_server, origin, path)
+
+    assert path.read_bytes() == BODY
+    assert digest == hashlib.sha256(BODY).hexdigest()
+    ranges = sorted((int(m[1]), int(m[2])) for m in map(_RANGE.fullmatch, origin.requests[1:]) if m)
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(BODY) - 1
+    assert all(prev[1] + 1 == cur[0] for prev, cur in itertools.pairwise(ranges))
+
+
+@pytest.mark.usefixtures("small_chunks")
+async def test_source_changing_mid_download_is_transient(
+    aiohttp_server, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(settings, "download_parallelism", 1)
+    origin = Origin(drop_at=100_000)
+
+    async def edit_after_first(request: web.Request) -> web.StreamResponse:
+        resp = await origin.handle(request)
+        origin.etag = '"v2"'
+        return resp
+
+    app = web.Application()
+    app.router.add_get("/media", edit_after_first)
+    server = await aiohttp_server(app)
+    async with aiohttp.ClientSession() as session, session.get(server.make_url("/media")) as resp:
+        with pytest.raises(TransientError):
+            await download_to_file(session, resp, tmp_path / "input")
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from typing import Any
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from ledger import JobLedger
+
+BUCKET = "mp3-converter"
+
+
+@pytest.fixture
+def s3() -> Iterator[Any]:
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+async def test_ledger_returns_the_last_mark(s3: Any) -> None:
+    ledger = JobLedger(s3, BUCKET, "_jobs")
+
+    assert await ledger.get("job-1") is None
+    await ledger.mark("job-1", file_key="a@b/job-1.mp3")
+    await ledger.mark("job-1", file_key="a@b/job-1.mp3", notified=True)
+
+    assert await ledger.get("job-1") == {"file_key": "a@b/job-1.mp3", "notified": True}
+    assert await ledger.get("job-2") is None